@@ -0,0 +1,86 @@
+"""
+In-process caching for MASER backend
+Small TTL + LRU cache with hit/miss counters, used to keep hot lookups
+(such as the authenticated user) off MongoDB
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from config import (
+    TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL_SECONDS,
+    USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS, STATS_CACHE_TTL_SECONDS,
+    VERSION_CACHE_MAX_ENTRIES, VERSION_CACHE_TTL_SECONDS
+)
+
+
+class TTLCache:
+    """
+    Least-recently-used cache whose entries also expire after a TTL
+    Not thread-safe; meant to be used from the event loop only
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+# Decoded JWT payloads keyed by the raw token
+token_cache = TTLCache(TOKEN_CACHE_MAX_ENTRIES, TOKEN_CACHE_TTL_SECONDS)
+
+# User documents (without password) keyed by user id
+user_cache = TTLCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+
+# Admin dashboard statistics
+stats_cache = TTLCache(1, STATS_CACHE_TTL_SECONDS)
+
+# Data version counters behind the list endpoints' ETags, keyed by version key
+version_cache = TTLCache(VERSION_CACHE_MAX_ENTRIES, VERSION_CACHE_TTL_SECONDS)
+
+
+def invalidate_user(user_id: str):
+    """Drop a cached user document after its MongoDB document changed"""
+    user_cache.invalidate(user_id)
@@ -19,16 +19,102 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production-
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 72
 
+# Password Hashing Configuration
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+
+# Cache Configuration
+# Cached entries may lag behind other workers' writes by up to the TTL
+TOKEN_CACHE_TTL_SECONDS = int(os.environ.get('TOKEN_CACHE_TTL_SECONDS', '300'))
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', '10000'))
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', '10000'))
+STATS_CACHE_TTL_SECONDS = int(os.environ.get('STATS_CACHE_TTL_SECONDS', '10'))
+VERSION_CACHE_TTL_SECONDS = int(os.environ.get('VERSION_CACHE_TTL_SECONDS', '2'))
+VERSION_CACHE_MAX_ENTRIES = int(os.environ.get('VERSION_CACHE_MAX_ENTRIES', '10000'))
+
 # CORS Configuration
 CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
 
 # Rate Limiting Configuration
 RATE_LIMIT_PER_MINUTE = int(os.environ.get('RATE_LIMIT_PER_MINUTE', '60'))
 RATE_LIMIT_PER_HOUR = int(os.environ.get('RATE_LIMIT_PER_HOUR', '1000'))
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # memory | redis (needs the 'redis' package)
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
 
 # Pagination Configuration
 DEFAULT_PAGE_SIZE = 20
 MAX_PAGE_SIZE = 100
+COUNT_CACHE_TTL_SECONDS = 30
+
+# Geospatial Query Configuration
+DEFAULT_NEARBY_RADIUS_METERS = 1000
+MAX_NEARBY_RADIUS_METERS = 50000
+DEFAULT_NEARBY_LIMIT = 50
+MAX_NEARBY_LIMIT = 200
+
+# Road geometry simplification: max zoom level -> Douglas-Peucker tolerance (degrees)
+# Zoom levels above the highest key are served at full detail
+ROAD_SIMPLIFICATION_LEVELS = {
+    8: 0.005,
+    11: 0.0005,
+    14: 0.00005,
+}
+DEFAULT_BBOX_LIMIT = 200
+MAX_BBOX_LIMIT = 1000
+
+# Near-duplicate road detection: a new road whose Hausdorff distance to an
+# existing pending/approved road is within the threshold is flagged
+DUPLICATE_ROAD_DISTANCE_METERS = float(os.environ.get('DUPLICATE_ROAD_DISTANCE_METERS', '15'))
+DUPLICATE_ROAD_CANDIDATE_LIMIT = 20
+DUPLICATE_ROAD_SHAPE_POINTS = 32  # vertices of the resampled `shape` stored per road
+
+# Encoded polyline precision (decimal places; 5 = ~1 m, Google's default)
+POLYLINE_PRECISION = 5
+
+# Vector Tile Configuration
+TILE_CACHE_DIR = Path(os.environ.get('TILE_CACHE_DIR', ROOT_DIR / 'tile_cache'))
+TILE_MEMORY_CACHE_SIZE = int(os.environ.get('TILE_MEMORY_CACHE_SIZE', '2000'))
+TILE_MIN_ZOOM = 2
+TILE_MAX_ZOOM = 18
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Background Job Configuration
+BROADCAST_BATCH_SIZE = 1000
+
+# Background Task Queue Configuration (request side effects such as notifications)
+TASK_QUEUE_MAX_SIZE = 10000  # queued items before enqueueing requests wait
+TASK_QUEUE_BATCH_SIZE = 500  # items handled per write
+TASK_QUEUE_RETRIES = 3  # attempts per batch before it is dropped and logged
+TASK_QUEUE_RETRY_DELAY_SECONDS = 0.5  # doubled after every failed attempt
+TASK_QUEUE_DRAIN_SECONDS = 10  # how long shutdown waits for queued items
+
+# Batch Submission Configuration
+MAX_BATCH_SUBMISSION_ITEMS = 500
+
+# Map Export Configuration
+EXPORT_BATCH_SIZE = 1000  # documents per MongoDB cursor batch and per written chunk
+
+# Notification Stream Configuration (Server-Sent Events)
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = 15  # keep-alive comment and cross-worker unread check
+# Streams are closed after this long so clients reconnect (and rebalance across workers)
+NOTIFICATION_STREAM_MAX_SECONDS = int(os.environ.get('NOTIFICATION_STREAM_MAX_SECONDS', '300'))
+NOTIFICATION_STREAM_QUEUE_SIZE = 100  # undelivered events kept per connection
+
+# Notification Retention Configuration (TTL indexes; 0 keeps notifications forever)
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '90'))
+# Read notifications are removed this long after being read
+NOTIFICATION_READ_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_READ_RETENTION_DAYS', '30'))
+
+# Logging Configuration
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')  # json | text
+# Fraction of requests written to the access log; errors and slow requests are always logged
+ACCESS_LOG_SAMPLE_RATE = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', '0.1'))
+ACCESS_LOG_SLOW_SECONDS = float(os.environ.get('ACCESS_LOG_SLOW_SECONDS', '1.0'))
 
 # Coin System Configuration
 COINS_PER_APPROVED_ROAD = 1
@@ -1,13 +1,25 @@
 """ 
 Database connection and initialization module
-Handles MongoDB connection, indexing, and connection pooling
+Handles MongoDB connection, versioned schema migrations (indexes and
+backfills), and connection pooling
 """
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_URL, DB_NAME
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+from pymongo import IndexModel, UpdateOne
+from typing import Optional
+from config import MONGO_URL, DB_NAME, NOTIFICATION_RETENTION_DAYS, NOTIFICATION_READ_RETENTION_DAYS
+from geo import encode_polyline, line_bounds, road_shape, to_geojson_linestring, simplify_levels
+from cache import stats_cache, version_cache
+from metrics import pool_listener
 import logging
 
 logger = logging.getLogger(__name__)
 
+DUPLICATE_KEY_ERROR = 11000
+
 # MongoDB client with connection pooling
 client = AsyncIOMotorClient(
     MONGO_URL,
@@ -15,53 +27,283 @@ client = AsyncIOMotorClient(
     minPoolSize=10,  # Minimum number of connections
     maxIdleTimeMS=45000,  # Close connections idle for 45 seconds
     serverSelectionTimeoutMS=5000,  # Timeout for server selection
+    event_listeners=[pool_listener],  # Pool usage for /api/metrics
 )
 
 db = client[DB_NAME]
 
 
+# Bump SCHEMA_VERSION whenever INDEXES or the data migrations change; a
+# process that finds the stored version current skips all of it
+SCHEMA_VERSION = 3
+SCHEMA_DOC_ID = "schema"
+
+IDEMPOTENCY_KEY_INDEX = IndexModel(
+    [("user_id", 1), ("idempotency_key", 1)],
+    unique=True,
+    partialFilterExpression={"idempotency_key": {"$exists": True}}
+)
+
+INDEXES = {
+    "users": [
+        IndexModel("email", unique=True),
+        IndexModel("id", unique=True),
+        IndexModel("created_at"),
+    ],
+    "roads": [
+        IndexModel("id", unique=True),
+        IndexModel("user_id"),
+        IndexModel("status"),
+        IndexModel([("status", 1), ("created_at", -1), ("id", -1)]),
+        IndexModel([("created_at", -1), ("id", -1)]),
+        IndexModel([("user_id", 1), ("created_at", -1)]),
+        IndexModel([("geo", "2dsphere"), ("status", 1)]),
+        IDEMPOTENCY_KEY_INDEX,
+    ],
+    "pois": [
+        IndexModel("id", unique=True),
+        IndexModel("user_id"),
+        IndexModel("status"),
+        IndexModel([("status", 1), ("category", 1)]),
+        IndexModel([("status", 1), ("created_at", -1), ("id", -1)]),
+        IndexModel([("created_at", -1), ("id", -1)]),
+        IndexModel([("user_id", 1), ("created_at", -1)]),
+        IndexModel([("geo", "2dsphere"), ("status", 1)]),
+        IDEMPOTENCY_KEY_INDEX,
+    ],
+    "personal_locations": [
+        IndexModel("id", unique=True),
+        IndexModel("user_id"),
+        IndexModel([("user_id", 1), ("created_at", -1)]),
+    ],
+    "notifications": [
+        IndexModel("id", unique=True),
+        IndexModel("user_id"),
+        IndexModel([("user_id", 1), ("read", 1)]),
+        IndexModel([("user_id", 1), ("created_at", -1), ("id", -1)]),
+    ],
+    "jobs": [
+        IndexModel("id", unique=True),
+    ],
+}
+
+# Indexes earlier versions created that an index in INDEXES now covers as
+# a prefix; dropped so inserts stop maintaining them
+SUPERSEDED_INDEXES = {
+    "roads": ["status_1_created_at_-1"],  # by (status, created_at, id)
+    "notifications": ["user_id_1_created_at_-1"],  # by (user_id, created_at, id)
+}
+
+
+def ttl_settings() -> dict:
+    """TTL indexes as currently configured: (collection, field) -> seconds"""
+    return {
+        ("notifications", "created_at"): NOTIFICATION_RETENTION_DAYS * 86400,
+        ("notifications", "read_at"): NOTIFICATION_READ_RETENTION_DAYS * 86400,
+    }
+
+
 async def init_database():
     """
-    Initialize database with indexes for better performance
-    This should be called on application startup
+    Bring the database schema up to date on application startup
+    A current schema costs one read: data migrations and index builds run
+    only when the stored schema version is behind SCHEMA_VERSION, and TTL
+    indexes are only touched when their configured retention changed.
+    Errors are raised, so a worker never starts on an incomplete schema
     """
     try:
-        logger.info("Initializing database indexes...")
+        record = await db.meta.find_one({"_id": SCHEMA_DOC_ID}) or {}
+        version = record.get("version", 0)
+        ttl = ttl_settings()
+        # Keys are "collection:field": field names containing "." are only
+        # accepted from MongoDB 5.0 on
+        stored_ttl = {tuple(key.split(":", 1)): value for key, value in record.get("ttl", {}).items()}
         
-        # Users collection indexes
-        await db.users.create_index("email", unique=True)
-        await db.users.create_index("id", unique=True)
-        await db.users.create_index("created_at")
+        if version >= SCHEMA_VERSION and stored_ttl == ttl:
+            logger.info(f"Database schema is current (version {version})")
+            return
         
-        # Roads collection indexes
-        await db.roads.create_index("id", unique=True)
-        await db.roads.create_index("user_id")
-        await db.roads.create_index("status")
-        await db.roads.create_index([("status", 1), ("created_at", -1)])
-        await db.roads.create_index([("user_id", 1), ("created_at", -1)])
+        if version < SCHEMA_VERSION:
+            logger.info(f"Migrating database schema from version {version} to {SCHEMA_VERSION}...")
+            await run_data_migrations()
+            await create_indexes()
+            await drop_superseded_indexes()
         
-        # POIs collection indexes
-        await db.pois.create_index("id", unique=True)
-        await db.pois.create_index("user_id")
-        await db.pois.create_index("status")
-        await db.pois.create_index([("status", 1), ("category", 1)])
-        await db.pois.create_index([("user_id", 1), ("created_at", -1)])
+        for (collection, field), seconds in ttl.items():
+            if stored_ttl.get((collection, field)) != seconds:
+                await ensure_ttl_index(db[collection], field, seconds)
         
-        # Personal locations collection indexes
-        await db.personal_locations.create_index("id", unique=True)
-        await db.personal_locations.create_index("user_id")
-        await db.personal_locations.create_index([("user_id", 1), ("created_at", -1)])
-        
-        # Notifications collection indexes
-        await db.notifications.create_index("id", unique=True)
-        await db.notifications.create_index("user_id")
-        await db.notifications.create_index([("user_id", 1), ("read", 1)])
-        await db.notifications.create_index([("user_id", 1), ("created_at", -1)])
-        
-        logger.info("Database indexes created successfully")
+        await db.meta.update_one(
+            {"_id": SCHEMA_DOC_ID},
+            {"$set": {
+                "version": max(version, SCHEMA_VERSION),
+                "ttl": {f"{collection}:{field}": seconds for (collection, field), seconds in ttl.items()},
+                "updated_at": datetime.now(timezone.utc),
+            }},
+            upsert=True
+        )
+        logger.info(f"Database schema is at version {max(version, SCHEMA_VERSION)}")
         
     except Exception as e:
-        logger.error(f"Error creating database indexes: {e}")
+        logger.error(f"Error initializing database schema: {e}")
+        raise
+
+
+async def run_data_migrations():
+    """Backfills for documents written by older versions; each is idempotent"""
+    await migrate_timestamps()
+    await migrate_road_geometries()
+    await migrate_poi_locations()
+    await migrate_read_notifications()
+    await migrate_moderation_batches()
+
+
+async def create_indexes():
+    """
+    Build every index in INDEXES, one create_indexes command per collection,
+    all collections concurrently; logs the indexes that did not exist yet
+    """
+    existing = await asyncio.gather(*(db[name].index_information() for name in INDEXES))
+    await asyncio.gather(*(db[name].create_indexes(models) for name, models in INDEXES.items()))
+    for (name, models), before in zip(INDEXES.items(), existing):
+        created = [model.document["name"] for model in models if model.document["name"] not in before]
+        if created:
+            logger.info(f"Created {name} indexes: {', '.join(created)}")
+
+
+async def drop_superseded_indexes():
+    """Drop the SUPERSEDED_INDEXES still present; run after their replacements exist"""
+    for name, indexes in SUPERSEDED_INDEXES.items():
+        existing = await db[name].index_information()
+        for index in indexes:
+            if index in existing:
+                await db[name].drop_index(index)
+                logger.info(f"Dropped superseded {name} index {index}")
+
+
+async def ensure_ttl_index(collection, field: str, seconds: int):
+    """
+    Keep a TTL index on field expiring documents after seconds; changing
+    the setting updates the index in place, 0 or less drops it
+    Documents without the field (or without a date in it) never expire
+    """
+    name = f"{field}_ttl"
+    existing = (await collection.index_information()).get(name)
+    if seconds <= 0:
+        if existing:
+            await collection.drop_index(name)
+            logger.info(f"Dropped TTL index {collection.name}.{name}")
+    elif existing is None:
+        await collection.create_index(field, name=name, expireAfterSeconds=seconds)
+    elif existing.get('expireAfterSeconds') != seconds:
+        await db.command("collMod", collection.name, index={"name": name, "expireAfterSeconds": seconds})
+        logger.info(f"Changed TTL of {collection.name}.{name} to {seconds}s")
+
+
+TIMESTAMP_FIELDS = {
+    "users": ["created_at"],
+    "roads": ["created_at"],
+    "pois": ["created_at"],
+    "personal_locations": ["created_at"],
+    "notifications": ["created_at"],
+    "jobs": ["created_at", "finished_at"],
+}
+
+
+async def migrate_timestamps():
+    """
+    Convert timestamps stored as ISO-8601 strings into native BSON dates
+    Runs server-side with $toDate; a no-op once every collection is converted
+    """
+    for collection, fields in TIMESTAMP_FIELDS.items():
+        for field in fields:
+            result = await db[collection].update_many(
+                {field: {"$type": "string"}},
+                [{"$set": {field: {"$toDate": f"${field}"}}}]
+            )
+            if result.modified_count:
+                logger.info(f"Migrated {result.modified_count} {collection}.{field} values to BSON dates")
+
+
+async def migrate_read_notifications():
+    """
+    Stamp `read_at` on notifications read before it was recorded, so the
+    read-retention TTL applies to them counting from now
+    """
+    result = await db.notifications.update_many(
+        {"read": True, "read_at": {"$exists": False}},
+        [{"$set": {"read_at": "$$NOW"}}]
+    )
+    if result.modified_count:
+        logger.info(f"Stamped read_at on {result.modified_count} read notifications")
+
+
+async def migrate_road_geometries(batch_size: int = 500):
+    """
+    Backfill the GeoJSON `geo` line, encoded `polyline` and duplicate-check
+    `shape` and `shape_bounds` for roads stored before they existed, plus the pre-simplified
+    geometries of approved roads
+    """
+    migrated = 0
+    ops = []
+    cursor = db.roads.find(
+        {"$or": [
+            {"geo": {"$exists": False}},
+            {"polyline": {"$exists": False}},
+            {"shape_bounds": {"$exists": False}},
+            {"status": "approved", "simplified": {"$exists": False}},
+        ]},
+        {"_id": 0, "id": 1, "coordinates": 1, "status": 1}
+    )
+    async for road in cursor:
+        update = {
+            "geo": to_geojson_linestring(road['coordinates']),
+            "polyline": encode_polyline(road['coordinates']),
+            "shape": road_shape(road['coordinates']),
+        }
+        update['shape_bounds'] = line_bounds(update['shape'])
+        if road.get('status') == 'approved':
+            update['simplified'] = simplify_levels(road['coordinates'])
+        ops.append(UpdateOne({"id": road['id']}, {"$set": update}))
+        if len(ops) >= batch_size:
+            await db.roads.bulk_write(ops, ordered=False)
+            migrated += len(ops)
+            ops = []
+    if ops:
+        await db.roads.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+    if migrated:
+        logger.info(f"Migrated {migrated} road geometries to GeoJSON")
+
+
+async def migrate_poi_locations():
+    """
+    Backfill the GeoJSON `geo` field for POIs stored before it existed
+    Runs server-side as a single update so no documents are pulled into Python
+    """
+    result = await db.pois.update_many(
+        {"geo": {"$exists": False}, "location.1": {"$exists": True}},
+        [{"$set": {"geo": {
+            "type": "Point",
+            "coordinates": [
+                {"$arrayElemAt": ["$location", 1]},
+                {"$arrayElemAt": ["$location", 0]},
+            ],
+        }}}]
+    )
+    if result.modified_count:
+        logger.info(f"Migrated {result.modified_count} POI locations to GeoJSON")
+
+
+async def migrate_moderation_batches():
+    """Remove the batch tags that batch moderation used to leave on claimed roads and POIs"""
+    for collection in (db.roads, db.pois):
+        result = await collection.update_many(
+            {"moderation_batch": {"$exists": True}},
+            {"$unset": {"moderation_batch": ""}}
+        )
+        if result.modified_count:
+            logger.info(f"Removed moderation batch tags from {result.modified_count} {collection.name}")
 
 
 async def close_database():
@@ -76,24 +318,136 @@ async def close_database():
         logger.error(f"Error closing database connection: {e}")
 
 
-async def get_database_stats():
+STATS_DOC_ID = "global"
+STATS_STATUSES = ("pending", "approved", "rejected")
+
+
+async def rebuild_database_stats() -> dict:
+    """
+    Recompute the materialized stats document from scratch
+    One aggregation round trip: users are grouped directly and road/POI
+    status counts are appended with $unionWith
+    """
+    pipeline = [
+        {"$group": {"_id": "users", "count": {"$sum": 1}, "coins": {"$sum": "$coins"}}},
+        {"$unionWith": {"coll": "roads", "pipeline": [
+            {"$group": {"_id": {"$concat": ["roads_", "$status"]}, "count": {"$sum": 1}}},
+        ]}},
+        {"$unionWith": {"coll": "pois", "pipeline": [
+            {"$group": {"_id": {"$concat": ["pois_", "$status"]}, "count": {"$sum": 1}}},
+        ]}},
+    ]
+    doc = {f"{kind}_{status}": 0 for kind in ("roads", "pois") for status in STATS_STATUSES}
+    doc.update(users=0, total_coins=0)
+    async for row in db.users.aggregate(pipeline):
+        if row['_id'] == "users":
+            doc['users'] = row['count']
+            doc['total_coins'] = row['coins']
+        elif row['_id'] in doc:
+            doc[row['_id']] = row['count']
+
+    await db.stats.replace_one({"_id": STATS_DOC_ID}, doc, upsert=True)
+    return doc
+
+
+async def increment_stats(**deltas):
+    """
+    Apply counter deltas to the materialized stats document
+    Never fails the calling request; a missing document is rebuilt on next read
+    """
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    try:
+        await db.stats.update_one({"_id": STATS_DOC_ID}, {"$inc": deltas})
+    except Exception as e:
+        logger.error(f"Error updating stats: {e}")
+
+
+async def record_status_change(kind: str, old_status: Optional[str], new_status: Optional[str]):
+    """Move one road/POI between status counters (None means created/deleted)"""
+    if old_status == new_status:
+        return
+    deltas = {}
+    if old_status in STATS_STATUSES:
+        deltas[f"{kind}_{old_status}"] = -1
+    if new_status in STATS_STATUSES:
+        deltas[f"{kind}_{new_status}"] = 1
+    await increment_stats(**deltas)
+
+
+async def get_database_stats(refresh: bool = False):
     """
     Get database statistics for monitoring
+    Served from the materialized stats document behind a short TTL cache
     """
     try:
+        stats = None if refresh else stats_cache.get(STATS_DOC_ID)
+        if stats is not None:
+            return stats
+        
+        doc = None if refresh else await db.stats.find_one({"_id": STATS_DOC_ID}, {"_id": 0})
+        if doc is None:
+            doc = await rebuild_database_stats()
+        doc.pop('_id', None)
+        
         stats = {
-            'users': await db.users.count_documents({}),
-            'roads_total': await db.roads.count_documents({}),
-            'roads_pending': await db.roads.count_documents({'status': 'pending'}),
-            'roads_approved': await db.roads.count_documents({'status': 'approved'}),
-            'pois_total': await db.pois.count_documents({}),
-            'pois_pending': await db.pois.count_documents({'status': 'pending'}),
-            'total_coins': sum([
-                user.get('coins', 0) 
-                async for user in db.users.find({}, {'coins': 1})
-            ]),
+            'users': doc['users'],
+            'roads_total': sum(doc[f"roads_{status}"] for status in STATS_STATUSES),
+            'roads_pending': doc['roads_pending'],
+            'roads_approved': doc['roads_approved'],
+            'roads_rejected': doc['roads_rejected'],
+            'pois_total': sum(doc[f"pois_{status}"] for status in STATS_STATUSES),
+            'pois_pending': doc['pois_pending'],
+            'pois_approved': doc['pois_approved'],
+            'pois_rejected': doc['pois_rejected'],
+            'total_coins': doc['total_coins'],
         }
+        stats_cache.set(STATS_DOC_ID, stats)
         return stats
     except Exception as e:
         logger.error(f"Error getting database stats: {e}")
         return {}
+
+
+async def bump_versions(*keys: str):
+    """
+    Advance the data version counters behind the list endpoints' ETags
+    Keys: "roads", "pois", "notifications" (broadcasts) and
+    "notifications:<user_id>". Never fails the calling request
+    """
+    if not keys:
+        return
+    try:
+        await db.versions.bulk_write([
+            UpdateOne(
+                {"_id": key},
+                # The epoch keeps ETags unique if the counter is ever reset
+                {"$inc": {"v": 1}, "$setOnInsert": {"epoch": uuid.uuid4().hex[:8]}},
+                upsert=True
+            )
+            for key in set(keys)
+        ], ordered=False)
+    except Exception as e:
+        logger.error(f"Error updating data versions: {e}")
+    for key in keys:
+        version_cache.invalidate(key)
+
+
+async def get_versions(*keys: str) -> str:
+    """
+    Current version of each key, joined into an ETag value
+    Served from a short TTL cache, so most conditional requests are answered
+    without a database round trip; other workers' writes show up within the TTL
+    """
+    versions = {key: version_cache.get(key) for key in keys}
+    missing = [key for key, version in versions.items() if version is None]
+    if missing:
+        found = {
+            doc['_id']: f"{doc['epoch']}.{doc['v']}"
+            async for doc in db.versions.find({"_id": {"$in": missing}})
+        }
+        for key in missing:
+            versions[key] = found.get(key, "0")
+            version_cache.set(key, versions[key])
+    return 'W/"' + "-".join(versions[key] for key in keys) + '"'
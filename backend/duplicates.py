@@ -0,0 +1,80 @@
+"""
+Near-duplicate road detection for MASER backend
+Finds an existing pending or approved road that traces the same street as
+a new submission: candidates come from the 2dsphere index and are compared
+by Hausdorff distance on the small fixed-size `shape` stored per road,
+after its stored `shape_bounds` rule out roads of a different extent
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from config import DUPLICATE_ROAD_CANDIDATE_LIMIT, DUPLICATE_ROAD_DISTANCE_METERS
+from database import db
+from geo import bbox_filter, bounds_margin, buffered_bounds, hausdorff_distance, line_bounds
+
+logger = logging.getLogger(__name__)
+
+
+def _bounds_ranges(shape: List[List[float]]) -> Dict[str, Tuple[float, float]]:
+    """
+    Allowed (low, high) per `shape_bounds` edge for a duplicate of shape
+    Every point of a duplicate is within the threshold of the line and the
+    other way round, so each edge of its bounds is within the threshold of
+    the matching edge; short side streets inside the area fail this
+    """
+    dlat, dlng = bounds_margin(shape, DUPLICATE_ROAD_DISTANCE_METERS)
+    ranges = {}
+    for edge, value in line_bounds(shape).items():
+        margin = dlat if edge.endswith("lat") else dlng
+        ranges[edge] = (value - margin, value + margin)
+    return ranges
+
+
+def closest_road(shape: List[List[float]], candidates: Iterable[dict]) -> Optional[dict]:
+    """
+    Return {"id", "distance"} of the candidate ({"id", "shape"}) closest to
+    shape within DUPLICATE_ROAD_DISTANCE_METERS, or None
+    """
+    best = None
+    limit = DUPLICATE_ROAD_DISTANCE_METERS
+    for candidate in candidates:
+        # Only a closer match matters, so stop each comparison past the best so far
+        distance = hausdorff_distance(shape, candidate['shape'], limit)
+        if distance <= limit:
+            best = {"id": candidate['id'], "distance": round(distance, 1)}
+            limit = distance
+    return best
+
+
+async def find_duplicate_road(shape: List[List[float]]) -> Optional[dict]:
+    """
+    Return {"id", "distance"} of the closest pending or approved road whose
+    shape is within DUPLICATE_ROAD_DISTANCE_METERS of the given one, or None
+    """
+    # A duplicate lies entirely inside the line's bounds grown by the
+    # threshold, which $geoWithin answers from the 2dsphere index; the
+    # bounds ranges narrow that down before the limit is applied
+    query = {
+        **bbox_filter("$geoWithin", *buffered_bounds(shape, DUPLICATE_ROAD_DISTANCE_METERS)),
+        "status": {"$in": ["pending", "approved"]},
+        "shape": {"$exists": True},
+    }
+    for edge, (low, high) in _bounds_ranges(shape).items():
+        query[f"shape_bounds.{edge}"] = {"$gte": low, "$lte": high}
+    candidates = await db.roads.find(
+        query,
+        {"_id": 0, "id": 1, "shape": 1}
+    ).limit(DUPLICATE_ROAD_CANDIDATE_LIMIT).to_list(DUPLICATE_ROAD_CANDIDATE_LIMIT)
+    return closest_road(shape, candidates)
+
+
+def find_duplicate_in(shape: List[List[float]], roads: Iterable[dict]) -> Optional[dict]:
+    """
+    Like find_duplicate_road, over road documents that are not stored yet
+    (the earlier roads of a batch upload)
+    """
+    ranges = _bounds_ranges(shape)
+    return closest_road(shape, (
+        road for road in roads
+        if all(low <= road['shape_bounds'][edge] <= high for edge, (low, high) in ranges.items())
+    ))
@@ -0,0 +1,96 @@
+"""
+Map data export for MASER backend
+Streams approved roads and POIs as GeoJSON features straight from MongoDB
+cursors, one batch at a time, so memory stays constant however large the
+map grows
+"""
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+import logging
+
+from config import EXPORT_BATCH_SIZE
+from database import db
+from geo import bbox_filter
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+ROAD_EXPORT_PROJECTION = {"_id": 0, "id": 1, "road_name": 1, "road_type": 1, "geo": 1, "created_at": 1}
+POI_EXPORT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "category": 1, "poi_type": 1, "geo": 1, "created_at": 1}
+
+MEDIA_TYPES = {
+    "geojson": "application/geo+json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def export_query(bounds: Optional[tuple] = None, since: Optional[datetime] = None) -> dict:
+    """
+    Filter for approved features, optionally meeting a (min_lat, min_lng,
+    max_lat, max_lng) box and created at or after `since`
+    """
+    query = {"status": "approved", "geo": {"$ne": None}}
+    if bounds:
+        query.update(bbox_filter("$geoIntersects", *bounds))
+    if since:
+        query["created_at"] = {"$gte": since}
+    return query
+
+
+def _feature(kind: str, doc: dict) -> dict:
+    geometry = doc.pop('geo')
+    return {
+        "type": "Feature",
+        "id": doc['id'],
+        "geometry": geometry,
+        "properties": {"kind": kind, **doc},
+    }
+
+
+async def _features(query: dict, kinds: List[str]) -> AsyncIterator[List[dict]]:
+    """Yield lists of at most EXPORT_BATCH_SIZE features, roads first"""
+    sources = {
+        "road": (db.roads, ROAD_EXPORT_PROJECTION),
+        "poi": (db.pois, POI_EXPORT_PROJECTION),
+    }
+    for kind in kinds:
+        collection, projection = sources[kind]
+        cursor = collection.find(query, projection, batch_size=EXPORT_BATCH_SIZE)
+        try:
+            batch = []
+            async for doc in cursor:
+                batch.append(_feature(kind, doc))
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            # Also runs when the client disconnects mid-stream
+            await cursor.close()
+
+
+async def stream_export(query: dict, kinds: List[str], fmt: str) -> AsyncIterator[bytes]:
+    """
+    Serialize features as a GeoJSON FeatureCollection or as NDJSON
+    (one Feature per line); each yielded chunk holds one cursor batch
+    """
+    exported = 0
+    try:
+        if fmt == "geojson":
+            yield b'{"type":"FeatureCollection","features":['
+            separator = b""
+            async for batch in _features(query, kinds):
+                yield separator + b",".join(dumps(feature) for feature in batch)
+                separator = b","
+                exported += len(batch)
+            yield b"]}\n"
+        else:
+            async for batch in _features(query, kinds):
+                yield b"".join(dumps(feature) + b"\n" for feature in batch)
+                exported += len(batch)
+    except Exception as e:
+        # Headers are already sent; the truncated body is the only signal left
+        logger.error(f"Map export failed after {exported} features: {e}")
+        raise
+    logger.info(f"Map export finished: {exported} features ({fmt})")
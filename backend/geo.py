@@ -0,0 +1,304 @@
+"""
+Geospatial helpers for MASER backend
+Converts between the API's [lat, lng] pairs and GeoJSON stored in MongoDB,
+simplifies road geometries for zoomed-out map views, compares road shapes,
+and converts road coordinates to and from the compact encoded polyline format
+"""
+import math
+from typing import List, Optional
+
+from config import DUPLICATE_ROAD_SHAPE_POINTS, POLYLINE_PRECISION, ROAD_SIMPLIFICATION_LEVELS
+
+METERS_PER_DEGREE = 111320.0
+# Longitude between vertices along a bbox polygon's top and bottom edges
+BBOX_EDGE_STEP_DEGREES = 0.1
+# Widest single polygon bbox_filter builds; wider boxes are split so no
+# piece repeats a point (-180 and 180) or covers more than a hemisphere
+BBOX_MAX_PIECE_DEGREES = 90.0
+# Polygon edges cannot lie on a pole: every vertex there is the same point
+BBOX_MAX_LAT = 89.9
+
+
+def to_geojson_point(location: List[float]) -> dict:
+    """Convert an API [lat, lng] pair to a GeoJSON Point ([lng, lat] order)"""
+    lat, lng = location
+    return {"type": "Point", "coordinates": [lng, lat]}
+
+
+def to_geojson_linestring(coordinates: List[List[float]]) -> Optional[dict]:
+    """
+    Convert API [lat, lng] pairs to a GeoJSON LineString
+    Consecutive duplicate points are dropped; returns None when fewer
+    than two distinct points remain (not a valid LineString)
+    """
+    line = []
+    for lat, lng in coordinates:
+        point = [lng, lat]
+        if not line or line[-1] != point:
+            line.append(point)
+    if len(line) < 2:
+        return None
+    return {"type": "LineString", "coordinates": line}
+
+
+def bbox_polygon(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> dict:
+    """
+    Build a closed GeoJSON Polygon for a bounding box
+    2dsphere queries treat polygon edges as geodesics, which bow towards the
+    pole between two points on the same parallel (about 0.2 degrees over 15
+    degrees of longitude). The top and bottom edges therefore get a vertex
+    every BBOX_EDGE_STEP_DEGREES so they follow their latitude.
+    Only valid for boxes narrower than 180 degrees; see bbox_filter
+    """
+    min_lat, max_lat = max(min_lat, -BBOX_MAX_LAT), min(max_lat, BBOX_MAX_LAT)
+    steps = max(1, math.ceil((max_lng - min_lng) / BBOX_EDGE_STEP_DEGREES))
+    lngs = [min_lng + (max_lng - min_lng) * i / steps for i in range(steps)] + [max_lng]
+    return {
+        "type": "Polygon",
+        "coordinates": [
+            [[lng, min_lat] for lng in lngs]
+            + [[lng, max_lat] for lng in reversed(lngs)]
+            + [[min_lng, min_lat]]
+        ],
+    }
+
+
+def bbox_filter(operator: str, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> dict:
+    """
+    Query fragment matching documents whose `geo` meets a bounding box
+    operator is "$geoIntersects" or "$geoWithin". Boxes wider than
+    BBOX_MAX_PIECE_DEGREES (zoomed-out viewports, up to the whole world) are
+    split into side-by-side pieces joined with $or; with $geoWithin a line
+    must then lie inside one piece
+    """
+    pieces = max(1, math.ceil((max_lng - min_lng) / BBOX_MAX_PIECE_DEGREES))
+    edges = [min_lng + (max_lng - min_lng) * i / pieces for i in range(pieces)] + [max_lng]
+    conditions = [
+        {"geo": {operator: {"$geometry": bbox_polygon(min_lat, west, max_lat, east)}}}
+        for west, east in zip(edges, edges[1:])
+    ]
+    return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
+
+def _perpendicular_distance(point, start, end, lng_scale: float) -> float:
+    """Distance from point to segment start-end in degree space, longitude scaled by latitude"""
+    px, py = point[1] * lng_scale, point[0]
+    ax, ay = start[1] * lng_scale, start[0]
+    bx, by = end[1] * lng_scale, end[0]
+    dx, dy = bx - ax, by - ay
+    if dx == 0 and dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify_line(coordinates: List[List[float]], tolerance: float) -> List[List[float]]:
+    """
+    Douglas-Peucker simplification of a [lat, lng] polyline
+    tolerance is in degrees; endpoints are always kept
+    """
+    if len(coordinates) < 3:
+        return list(coordinates)
+
+    lng_scale = math.cos(math.radians(coordinates[0][0]))
+    keep = [False] * len(coordinates)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(coordinates) - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        max_dist = 0.0
+        index = first
+        for i in range(first + 1, last):
+            dist = _perpendicular_distance(coordinates[i], coordinates[first], coordinates[last], lng_scale)
+            if dist > max_dist:
+                max_dist = dist
+                index = i
+        if max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+
+    return [coord for coord, kept in zip(coordinates, keep) if kept]
+
+
+def simplify_levels(coordinates: List[List[float]]) -> dict:
+    """Pre-compute one simplified geometry per configured zoom level"""
+    return {
+        str(max_zoom): simplify_line(coordinates, tolerance)
+        for max_zoom, tolerance in ROAD_SIMPLIFICATION_LEVELS.items()
+    }
+
+
+def simplification_level(zoom: int) -> Optional[str]:
+    """Pick the simplified geometry key for a zoom level, or None for full detail"""
+    for max_zoom in sorted(ROAD_SIMPLIFICATION_LEVELS):
+        if zoom <= max_zoom:
+            return str(max_zoom)
+    return None
+
+
+def bounds_margin(coordinates: List[List[float]], meters: float) -> tuple:
+    """(dlat, dlng) in degrees covering `meters` anywhere along a line"""
+    dlat = meters / METERS_PER_DEGREE
+    dlng = dlat / max(math.cos(math.radians(max(abs(lat) for lat, _ in coordinates))), 0.01)
+    return dlat, dlng
+
+
+def line_bounds(coordinates: List[List[float]]) -> dict:
+    """Bounding box of a [lat, lng] line as stored in a road's `shape_bounds`"""
+    lats = [lat for lat, _ in coordinates]
+    lngs = [lng for _, lng in coordinates]
+    return {"min_lat": min(lats), "min_lng": min(lngs), "max_lat": max(lats), "max_lng": max(lngs)}
+
+
+def buffered_bounds(coordinates: List[List[float]], meters: float) -> tuple:
+    """(min_lat, min_lng, max_lat, max_lng) of a line, grown by `meters` on every side"""
+    lats = [lat for lat, _ in coordinates]
+    lngs = [lng for _, lng in coordinates]
+    dlat, dlng = bounds_margin(coordinates, meters)
+    return (
+        max(min(lats) - dlat, -90.0), max(min(lngs) - dlng, -180.0),
+        min(max(lats) + dlat, 90.0), min(max(lngs) + dlng, 180.0),
+    )
+
+
+def resample_line(coordinates: List[List[float]], count: int) -> List[List[float]]:
+    """
+    `count` points spaced evenly along a [lat, lng] line, endpoints included
+    Gives every road the same small number of vertices regardless of how
+    densely (or noisily) it was traced
+    """
+    lng_scale = math.cos(math.radians(coordinates[0][0]))
+    lengths = [0.0]
+    for (lat1, lng1), (lat2, lng2) in zip(coordinates, coordinates[1:]):
+        lengths.append(lengths[-1] + math.hypot(lat2 - lat1, (lng2 - lng1) * lng_scale))
+    total = lengths[-1]
+    if total == 0:
+        return [list(coordinates[0]), list(coordinates[-1])]
+
+    points = []
+    segment = 0
+    for i in range(count):
+        target = total * i / (count - 1)
+        while segment < len(coordinates) - 2 and lengths[segment + 1] < target:
+            segment += 1
+        span = lengths[segment + 1] - lengths[segment]
+        t = (target - lengths[segment]) / span if span else 0.0
+        (lat1, lng1), (lat2, lng2) = coordinates[segment], coordinates[segment + 1]
+        points.append([lat1 + (lat2 - lat1) * t, lng1 + (lng2 - lng1) * t])
+    return points
+
+
+def road_shape(coordinates: List[List[float]]) -> List[List[float]]:
+    """Small resampled line stored with each road for duplicate comparisons"""
+    return resample_line(coordinates, DUPLICATE_ROAD_SHAPE_POINTS)
+
+
+def _segments(line: List[List[float]], lng_scale: float) -> List[tuple]:
+    """(x, y, dx, dy, squared length) per segment, x being the scaled longitude"""
+    points = [(lng * lng_scale, lat) for lat, lng in line]
+    if len(points) < 2:
+        points = points * 2
+    return [
+        (ax, ay, bx - ax, by - ay, (bx - ax) ** 2 + (by - ay) ** 2)
+        for (ax, ay), (bx, by) in zip(points, points[1:])
+    ]
+
+
+def hausdorff_distance(a: List[List[float]], b: List[List[float]], limit: float = math.inf) -> float:
+    """
+    Symmetric Hausdorff distance in meters between two [lat, lng] lines
+    Every vertex is measured against the other line's segments, so two
+    traces of the same street sampled at different points still compare
+    as close. Returns early with a value above `limit` once it is exceeded
+    """
+    lng_scale = math.cos(math.radians(a[0][0]))
+    limit = (limit / METERS_PER_DEGREE) ** 2
+    worst = 0.0  # squared, in degrees
+    for line, other in ((a, b), (b, a)):
+        segments = _segments(other, lng_scale)
+        count = len(segments)
+        hint = 0
+        for lat, lng in line:
+            px, py = lng * lng_scale, lat
+            # Search outwards from the segment nearest the previous vertex:
+            # along similar lines (traced either way) it settles most
+            # vertices at once
+            nearest = math.inf
+            first = hint
+            for step in range(2 * count - 1):
+                index = first + (step + 1) // 2 if step % 2 else first - step // 2
+                if not 0 <= index < count:
+                    continue
+                ax, ay, dx, dy, length = segments[index]
+                t = ((px - ax) * dx + (py - ay) * dy) / length if length else 0.0
+                t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+                ex, ey = px - ax - t * dx, py - ay - t * dy
+                dist = ex * ex + ey * ey
+                if dist < nearest:
+                    nearest, hint = dist, index
+                    if nearest <= worst:
+                        break  # cannot raise the maximum
+            if nearest > worst:
+                worst = nearest
+                if worst > limit:
+                    break
+        if worst > limit:
+            break
+    return math.sqrt(worst) * METERS_PER_DEGREE
+
+
+def encode_polyline(coordinates: List[List[float]], precision: int = POLYLINE_PRECISION) -> str:
+    """
+    Encode [lat, lng] pairs with the Google encoded polyline algorithm:
+    fixed-point deltas between consecutive points as base64-like varints
+    """
+    factor = 10 ** precision
+    chunks = []
+    prev_lat = prev_lng = 0
+    for lat, lng in coordinates:
+        lat, lng = round(lat * factor), round(lng * factor)
+        for delta in (lat - prev_lat, lng - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        prev_lat, prev_lng = lat, lng
+    return "".join(chunks)
+
+
+def decode_polyline(polyline: str, precision: int = POLYLINE_PRECISION) -> List[List[float]]:
+    """Decode an encoded polyline into [lat, lng] pairs; raises ValueError when malformed"""
+    factor = 10 ** precision
+    coordinates = []
+    values = []
+    value = shift = 0
+    for char in polyline:
+        byte = ord(char) - 63
+        if not 0 <= byte < 64:
+            raise ValueError("invalid polyline character")
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    if shift or len(values) % 2:
+        raise ValueError("truncated polyline")
+
+    lat = lng = 0
+    for i in range(0, len(values), 2):
+        lat += values[i]
+        lng += values[i + 1]
+        coordinates.append([lat / factor, lng / factor])
+    return coordinates
+
+
+def polyline_roads(roads: List[dict], field: str = 'coordinates') -> List[dict]:
+    """Replace each road's coordinates (read from `field`) with its encoded `polyline`, in place"""
+    for road in roads:
+        coordinates = road.pop(field, None)
+        if 'polyline' not in road:
+            road['polyline'] = encode_polyline(coordinates or [])
+    return roads
@@ -0,0 +1,108 @@
+"""
+Background jobs for MASER backend
+Long-running admin operations (such as broadcast notifications) run as
+asyncio tasks; their progress is stored in the `jobs` collection so any
+worker can report it
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+import logging
+
+from config import BROADCAST_BATCH_SIZE
+from database import db, bump_versions
+from notifications import publish_notifications
+
+logger = logging.getLogger(__name__)
+
+# Strong references so running tasks are not garbage collected
+_running_tasks = set()
+
+
+async def _run_broadcast(job_id: str, title: str, message: str):
+    """Stream every user id and insert their notifications in batches"""
+    processed = 0
+    created_at = datetime.now(timezone.utc)
+    try:
+        await db.jobs.update_one({"id": job_id}, {"$set": {"status": "running"}})
+
+        batch = []
+        cursor = db.users.find({}, {"_id": 0, "id": 1}).batch_size(BROADCAST_BATCH_SIZE)
+        async for user in cursor:
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user['id'],
+                "title": title,
+                "message": message,
+                "read": False,
+                "created_at": created_at,
+            })
+            if len(batch) >= BROADCAST_BATCH_SIZE:
+                await db.notifications.insert_many(batch, ordered=False)
+                publish_notifications(batch)
+                await bump_versions("notifications")
+                processed += len(batch)
+                batch = []
+                await db.jobs.update_one({"id": job_id}, {"$set": {"processed": processed}})
+
+        if batch:
+            await db.notifications.insert_many(batch, ordered=False)
+            publish_notifications(batch)
+            await bump_versions("notifications")
+            processed += len(batch)
+
+        await db.jobs.update_one({"id": job_id}, {"$set": {
+            "status": "completed",
+            "processed": processed,
+            "finished_at": datetime.now(timezone.utc),
+        }})
+        logger.info(f"Broadcast notification sent to {processed} users (job {job_id})")
+
+    except asyncio.CancelledError:
+        logger.warning(f"Broadcast job {job_id} cancelled after {processed} users")
+        await db.jobs.update_one({"id": job_id}, {"$set": {
+            "status": "cancelled",
+            "processed": processed,
+            "finished_at": datetime.now(timezone.utc),
+        }})
+        raise
+    except Exception as e:
+        logger.error(f"Broadcast job {job_id} failed after {processed} users: {e}")
+        await db.jobs.update_one({"id": job_id}, {"$set": {
+            "status": "failed",
+            "processed": processed,
+            "error": str(e),
+            "finished_at": datetime.now(timezone.utc),
+        }})
+
+
+async def start_broadcast(title: str, message: str) -> str:
+    """Record a broadcast job and start it in the background; returns the job id"""
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": "broadcast",
+        "status": "queued",
+        "total": await db.users.estimated_document_count(),
+        "processed": 0,
+        "created_at": datetime.now(timezone.utc),
+        "finished_at": None,
+        "error": None,
+    }
+    await db.jobs.insert_one(job)
+
+    task = asyncio.create_task(_run_broadcast(job['id'], title, message))
+    _running_tasks.add(task)
+    task.add_done_callback(_running_tasks.discard)
+    return job['id']
+
+
+async def get_job(job_id: str):
+    """Fetch a job's progress document"""
+    return await db.jobs.find_one({"id": job_id}, {"_id": 0})
+
+
+async def cancel_jobs():
+    """Cancel jobs still running in this process (on shutdown)"""
+    for task in list(_running_tasks):
+        task.cancel()
+    await asyncio.gather(*_running_tasks, return_exceptions=True)
@@ -0,0 +1,90 @@
+"""
+Logging setup for MASER backend
+Log calls only put the record on an in-memory queue; a QueueListener
+thread formats it (JSON or text) and writes it out, so slow or blocked
+log output never stalls the event loop
+"""
+import atexit
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from config import LOG_FORMAT, LOG_LEVEL
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed with `extra=` become top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Enqueue records without formatting them
+    The stock handler formats on the calling thread; only the message
+    arguments are merged here, everything else happens on the listener
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging() -> QueueListener:
+    """Route the root logger (and uvicorn's loggers) through the background writer"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [_QueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn installs its own synchronous handlers; send its records through
+    # the queue too, and drop its access log in favour of the sampled one
+    for name in ('uvicorn', 'uvicorn.error', 'uvicorn.access'):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+    logging.getLogger('uvicorn.access').disabled = True
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Write out everything still queued and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
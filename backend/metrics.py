@@ -0,0 +1,246 @@
+"""
+Metrics for MASER backend
+Minimal in-process counters, gauges and histograms rendered in the
+Prometheus text exposition format; recording a sample is a dict lookup and
+an addition, so it can run on every request
+"""
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from pymongo import monitoring
+
+from cache import stats_cache, token_cache, user_cache, version_cache
+from passwords import pending_count
+from pubsub import notification_hub
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Request latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        """Exposition lines for the current values, without the HELP/TYPE header"""
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class _Values(Metric):
+    """
+    One value per label combination; either recorded directly or read at
+    scrape time from a callback returning {label tuple: value}
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        callback: Optional[Callable[[], Dict[Tuple, float]]] = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._callback = callback
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        values = self._callback() if self._callback else self._values
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Counter(_Values):
+    """Monotonic count per label combination"""
+    kind = "counter"
+
+
+class Gauge(_Values):
+    """Current value per label combination"""
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Bucketed observations per label combination, for quantiles such as p99"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = 'le="' + bound + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+def render() -> bytes:
+    """All registered metrics in the Prometheus text format"""
+    return "".join(metric.render() for metric in _registry).encode("utf-8")
+
+
+# ==================== HTTP ====================
+
+http_requests = Counter(
+    "maser_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_latency = Histogram(
+    "maser_http_request_duration_seconds", "HTTP request latency until the response is fully sent",
+    ("method", "route")
+)
+http_in_flight = Gauge("maser_http_requests_in_flight", "HTTP requests currently being handled")
+rate_limit_rejections = Counter(
+    "maser_rate_limit_rejections_total", "Requests rejected by the rate limiter", ("window",)
+)
+
+
+# ==================== MongoDB connection pool ====================
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """
+    Tracks Motor's connection pools through pymongo's monitoring events
+    Events arrive on driver threads, hence the lock
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open: Dict[str, int] = {}
+        self.checked_out: Dict[str, int] = {}
+        self.checkout_failures: Dict[str, int] = {}
+
+    def _add(self, counts: Dict[str, int], address, amount: int = 1):
+        key = f"{address[0]}:{address[1]}"
+        with self._lock:
+            counts[key] = counts.get(key, 0) + amount
+
+    def connection_created(self, event):
+        self._add(self.open, event.address)
+
+    def connection_closed(self, event):
+        self._add(self.open, event.address, -1)
+
+    def connection_checked_out(self, event):
+        self._add(self.checked_out, event.address)
+
+    def connection_checked_in(self, event):
+        self._add(self.checked_out, event.address, -1)
+
+    def connection_check_out_failed(self, event):
+        self._add(self.checkout_failures, event.address)
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self, counts: Dict[str, int]) -> Dict[Tuple, int]:
+        with self._lock:
+            return {(address,): value for address, value in counts.items()}
+
+
+pool_listener = PoolListener()
+
+Gauge(
+    "maser_mongo_pool_connections", "Open MongoDB connections per server", ("address",),
+    callback=lambda: pool_listener.snapshot(pool_listener.open)
+)
+Gauge(
+    "maser_mongo_pool_checked_out", "MongoDB connections currently in use per server", ("address",),
+    callback=lambda: pool_listener.snapshot(pool_listener.checked_out)
+)
+Counter(
+    "maser_mongo_pool_checkout_failures_total", "Failed MongoDB connection checkouts per server", ("address",),
+    callback=lambda: pool_listener.snapshot(pool_listener.checkout_failures)
+)
+
+
+# ==================== In-process caches ====================
+
+def _cache_stats(field: str):
+    def collect():
+        return {(name,): cache.stats()[field] for name, cache in CACHES.items()}
+    return collect
+
+
+CACHES = {"token": token_cache, "user": user_cache, "stats": stats_cache, "version": version_cache}
+
+Counter("maser_cache_hits_total", "In-process cache hits", ("cache",), callback=_cache_stats('hits'))
+Counter("maser_cache_misses_total", "In-process cache misses", ("cache",), callback=_cache_stats('misses'))
+Gauge("maser_cache_entries", "In-process cache entries", ("cache",), callback=_cache_stats('size'))
+Gauge(
+    "maser_password_hash_pending", "bcrypt calls queued or running on the hashing pool",
+    callback=lambda: {(): pending_count()}
+)
+Gauge(
+    "maser_notification_streams", "Open notification event streams",
+    callback=lambda: {(): notification_hub.connection_count()}
+)
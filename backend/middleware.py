@@ -1,118 +1,233 @@
 """ 
 Custom middleware for MASER application
-Includes rate limiting, security headers, and request logging
+Includes rate limiting, security headers, compression, request logging and metrics
+Implemented as pure ASGI middleware so no per-request task or body
+stream wrapping is added and streaming responses pass straight through
 """
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
-from datetime import datetime, timedelta
-from collections import defaultdict
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware as StarletteGZipMiddleware
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import random
 import time
 import logging
-from config import RATE_LIMIT_PER_MINUTE, RATE_LIMIT_PER_HOUR, SECURITY_HEADERS
+from config import (
+    RATE_LIMIT_PER_MINUTE, RATE_LIMIT_PER_HOUR, SECURITY_HEADERS,
+    ACCESS_LOG_SAMPLE_RATE, ACCESS_LOG_SLOW_SECONDS
+)
+from ratelimit import MemoryRateLimitBackend, create_backend
+from metrics import Gauge, http_in_flight, http_latency, http_requests, rate_limit_rejections
 
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('access')
 
-# In-memory rate limiting store (use Redis in production)
-rate_limit_store = defaultdict(lambda: {'minute': [], 'hour': []})
+# Rate limit store; memory per worker, or shared through RATE_LIMIT_BACKEND=redis
+rate_limit_backend = create_backend()
 
+RATE_LIMITS = [(60, RATE_LIMIT_PER_MINUTE), (3600, RATE_LIMIT_PER_HOUR)]
+RATE_LIMIT_MESSAGES = [
+    "تعداد درخواست‌ها بیش از حد مجاز است. لطفا کمی صبر کنید.",
+    "تعداد درخواست‌های ساعتی شما به حد مجاز رسیده است.",
+]
+RATE_LIMIT_EXEMPT_PATHS = {'/api/', '/api/health', '/api/metrics'}
+RATE_LIMIT_WINDOW_NAMES = ["minute", "hour"]
+# Event streams must reach the client as written; gzip would hold them back
+GZIP_EXEMPT_PATHS = {'/api/notifications/stream'}
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+if isinstance(rate_limit_backend, MemoryRateLimitBackend):
+    Gauge(
+        "maser_rate_limit_tracked_keys", "Client keys held by the in-memory rate limiter",
+        callback=lambda: {(): len(rate_limit_backend)}
+    )
+
+# Header names/values pre-encoded once for the raw ASGI header list
+_SECURITY_HEADERS_RAW = [
+    (name.lower().encode('latin-1'), value.encode('latin-1'))
+    for name, value in SECURITY_HEADERS.items()
+]
+_SECURITY_HEADER_NAMES = {name for name, _ in _SECURITY_HEADERS_RAW}
+
+
+def _client_host(scope: Scope) -> str:
+    client = scope.get('client')
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
     """
     Rate limiting middleware to prevent abuse
-    Limits requests per IP address
+    Limits requests per IP address with sliding-window counters
+    Pure ASGI: headers are added to the `http.response.start` message
     """
     
-    async def dispatch(self, request: Request, call_next):
-        # Skip rate limiting for health check endpoints
-        if request.url.path in ['/api/', '/api/health']:
-            return await call_next(request)
-        
-        client_ip = request.client.host
-        current_time = time.time()
-        
-        # Clean old entries
-        rate_limit_store[client_ip]['minute'] = [
-            t for t in rate_limit_store[client_ip]['minute'] 
-            if current_time - t < 60
-        ]
-        rate_limit_store[client_ip]['hour'] = [
-            t for t in rate_limit_store[client_ip]['hour'] 
-            if current_time - t < 3600
-        ]
-        
-        # Check rate limits
-        minute_count = len(rate_limit_store[client_ip]['minute'])
-        hour_count = len(rate_limit_store[client_ip]['hour'])
-        
-        if minute_count >= RATE_LIMIT_PER_MINUTE:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip} (per minute)")
-            raise HTTPException(
-                status_code=429,
-                detail="تعداد درخواست‌ها بیش از حد مجاز است. لطفا کمی صبر کنید."
-            )
-        
-        if hour_count >= RATE_LIMIT_PER_HOUR:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip} (per hour)")
-            raise HTTPException(
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Skip rate limiting for non-HTTP traffic and health check endpoints
+        if scope['type'] != 'http' or scope['path'] in RATE_LIMIT_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        client_ip = _client_host(scope)
+        result = await rate_limit_backend.hit(client_ip, RATE_LIMITS)
+        
+        if not result.allowed:
+            window = RATE_LIMIT_WINDOW_NAMES[result.exceeded]
+            rate_limit_rejections.inc(window)
+            logger.warning("Rate limit exceeded for IP: %s (per %s)", client_ip, window)
+            response = JSONResponse(
                 status_code=429,
-                detail="تعداد درخواست‌های ساعتی شما به حد مجاز رسیده است."
+                content={"detail": RATE_LIMIT_MESSAGES[result.exceeded]},
+                headers={"Retry-After": str(RATE_LIMITS[result.exceeded][0])}
             )
+            await response(scope, receive, send)
+            return
+        
+        rate_headers = [
+            (b'x-ratelimit-limit-minute', str(RATE_LIMIT_PER_MINUTE).encode()),
+            (b'x-ratelimit-remaining-minute', str(result.remaining[0]).encode()),
+            (b'x-ratelimit-limit-hour', str(RATE_LIMIT_PER_HOUR).encode()),
+            (b'x-ratelimit-remaining-hour', str(result.remaining[1]).encode()),
+        ]
         
-        # Add current request
-        rate_limit_store[client_ip]['minute'].append(current_time)
-        rate_limit_store[client_ip]['hour'].append(current_time)
-        
-        response = await call_next(request)
-        
-        # Add rate limit headers
-        response.headers['X-RateLimit-Limit-Minute'] = str(RATE_LIMIT_PER_MINUTE)
-        response.headers['X-RateLimit-Remaining-Minute'] = str(RATE_LIMIT_PER_MINUTE - minute_count - 1)
-        response.headers['X-RateLimit-Limit-Hour'] = str(RATE_LIMIT_PER_HOUR)
-        response.headers['X-RateLimit-Remaining-Hour'] = str(RATE_LIMIT_PER_HOUR - hour_count - 1)
+        async def send_with_headers(message: Message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = list(message.get('headers', [])) + rate_headers
+            await send(message)
         
-        return response
+        await self.app(scope, receive, send_with_headers)
 
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+class SecurityHeadersMiddleware:
     """
     Add security headers to all responses
     """
     
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Add security headers
-        for header, value in SECURITY_HEADERS.items():
-            response.headers[header] = value
-        
-        return response
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_with_headers(message: Message):
+            if message['type'] == 'http.response.start':
+                headers = [
+                    (name, value) for name, value in message.get('headers', [])
+                    if name.lower() not in _SECURITY_HEADER_NAMES
+                ]
+                message['headers'] = headers + _SECURITY_HEADERS_RAW
+            await send(message)
+        
+        await self.app(scope, receive, send_with_headers)
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class GZipMiddleware(StarletteGZipMiddleware):
+    """Starlette's GZip middleware, skipping the paths in GZIP_EXEMPT_PATHS"""
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] == 'http' and scope['path'] in GZIP_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+class RequestLoggingMiddleware:
     """
-    Log all incoming requests for monitoring and debugging
+    Access log for monitoring and debugging: one line per request, written
+    for a sampled fraction of requests plus every 5xx and slow request
     """
     
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        
-        # Log request
-        logger.info(
-            f"Request: {request.method} {request.url.path} "
-            f"from {request.client.host}"
-        )
-        
-        response = await call_next(request)
-        
-        # Log response
-        process_time = time.time() - start_time
-        logger.info(
-            f"Response: {response.status_code} "
-            f"in {process_time:.2f}s"
-        )
-        
-        # Add process time header
-        response.headers['X-Process-Time'] = f"{process_time:.4f}"
-        
-        return response
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        
+        async def send_with_timing(message: Message):
+            if message['type'] == 'http.response.start':
+                process_time = time.perf_counter() - start_time
+                status = message['status']
+                
+                if (
+                    status >= 500
+                    or process_time >= ACCESS_LOG_SLOW_SECONDS
+                    or random.random() < ACCESS_LOG_SAMPLE_RATE
+                ):
+                    access_logger.info(
+                        "%s %s %s %.1fms", scope['method'], scope['path'], status, process_time * 1000,
+                        extra={
+                            "method": scope['method'],
+                            "path": scope['path'],
+                            "status": status,
+                            "duration_ms": round(process_time * 1000, 1),
+                            "client": _client_host(scope),
+                        }
+                    )
+                
+                # Add process time header
+                message['headers'] = list(message.get('headers', [])) + [
+                    (b'x-process-time', f"{process_time:.4f}".encode())
+                ]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_timing)
+
+
+# Endpoint function -> route path template, filled from the app's routes
+_route_paths = {}
+
+
+def _route_label(scope: Scope) -> str:
+    """
+    Route template of the matched endpoint (e.g. `/api/roads/{road_id}`),
+    so path parameters do not create one time series per id
+    """
+    endpoint = scope.get('endpoint')
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        for route in getattr(scope.get('app'), 'routes', []):
+            _route_paths.setdefault(getattr(route, 'endpoint', None), route.path)
+        path = _route_paths.setdefault(endpoint, "unmatched")
+    return path
+
+
+class MetricsMiddleware:
+    """
+    Record request count, latency and in-flight requests per route
+    Latency runs until the last body chunk is sent, so streamed
+    responses are measured in full
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        status = 500
+        
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+        
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            method, route = scope['method'], _route_label(scope)
+            http_requests.inc(method, route, str(status))
+            http_latency.observe(time.perf_counter() - start_time, method, route)
@@ -2,12 +2,22 @@
 Pydantic models for request/response validation
 All data models used in the API
 """
-from pydantic import BaseModel, Field, ConfigDict, EmailStr, field_validator
-from typing import List, Optional
+from pydantic import AfterValidator, BaseModel, Field, ConfigDict, EmailStr, field_validator, model_validator
+from typing import Annotated, List, Optional
 from datetime import datetime, timezone
 import uuid
 import re
 
+from geo import decode_polyline
+
+
+def _assume_utc(v: datetime) -> datetime:
+    # MongoDB stores dates in UTC and the driver returns them naive
+    return v.replace(tzinfo=timezone.utc) if v.tzinfo is None else v
+
+
+UTCDatetime = Annotated[datetime, AfterValidator(_assume_utc)]
+
 
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -15,7 +25,7 @@ class User(BaseModel):
     email: EmailStr
     full_name: str
     coins: int = 0
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UTCDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
     @field_validator('full_name')
     @classmethod
@@ -62,7 +72,8 @@ class RoadSubmission(BaseModel):
     coordinates: List[List[float]]
     status: str = "pending"
     coin_awarded: bool = False
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    duplicate_of: Optional[str] = None  # id of an existing road tracing the same street
+    created_at: UTCDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
     @field_validator('road_name')
     @classmethod
@@ -102,7 +113,20 @@ class RoadSubmission(BaseModel):
 class RoadSubmissionCreate(BaseModel):
     road_name: str
     road_type: str
-    coordinates: List[List[float]]
+    coordinates: Optional[List[List[float]]] = None
+    polyline: Optional[str] = Field(None, max_length=16000)  # encoded polyline, alternative to coordinates
+    
+    @model_validator(mode='after')
+    def decode_coordinates(self):
+        if self.coordinates is None:
+            if self.polyline is None:
+                raise ValueError('مختصات یا polyline مسیر الزامی است')
+            try:
+                self.coordinates = decode_polyline(self.polyline)
+            except ValueError:
+                raise ValueError('polyline مسیر نامعتبر است')
+        self.polyline = None
+        return self
 
 
 class POI(BaseModel):
@@ -114,7 +138,7 @@ class POI(BaseModel):
     poi_type: str
     location: List[float]
     status: str = "pending"
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UTCDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
     @field_validator('name')
     @classmethod
@@ -159,7 +183,7 @@ class PersonalLocation(BaseModel):
     user_id: str
     name: str
     location: List[float]
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UTCDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     
     @field_validator('name')
     @classmethod
@@ -183,7 +207,7 @@ class Notification(BaseModel):
     title: str
     message: str
     read: bool = False
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    created_at: UTCDatetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
 class NotificationBroadcast(BaseModel):
@@ -210,6 +234,32 @@ class NotificationBroadcast(BaseModel):
         return v.strip()
 
 
+class NotificationsRead(BaseModel):
+    """Notification ids to mark as read; omit ids to mark all of them"""
+    ids: Optional[List[str]] = None
+    
+    @field_validator('ids')
+    @classmethod
+    def validate_ids(cls, v):
+        if v is not None and len(v) > 1000:
+            raise ValueError('تعداد اعلان‌ها نباید بیشتر از 1000 باشد')
+        return v
+
+
+class ModerationBatch(BaseModel):
+    approve_roads: List[str] = []
+    reject_roads: List[str] = []
+    approve_pois: List[str] = []
+    reject_pois: List[str] = []
+    
+    @field_validator('approve_roads', 'reject_roads', 'approve_pois', 'reject_pois')
+    @classmethod
+    def validate_ids(cls, v):
+        if len(v) > 1000:
+            raise ValueError('تعداد موارد هر فهرست نباید بیشتر از 1000 باشد')
+        return v
+
+
 class PaginatedResponse(BaseModel):
     items: List
     total: int
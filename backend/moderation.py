@@ -0,0 +1,175 @@
+"""
+Moderation logic for MASER backend
+Approving/rejecting roads and POIs; every status change is conditional on
+the item still being `pending`, so concurrent moderators can never award
+coins twice, and all follow-up writes are batched per collection
+"""
+import asyncio
+import uuid
+from collections import Counter
+from typing import List
+import logging
+
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from config import COINS_PER_APPROVED_ROAD
+from database import db, increment_stats, bump_versions
+from cache import invalidate_user
+from geo import simplify_levels
+from notifications import build_notification, create_notifications
+from tiles import tile_cache
+
+logger = logging.getLogger(__name__)
+
+ROAD_PROJECTION = {"_id": 0, "id": 1, "user_id": 1, "road_name": 1, "coordinates": 1}
+POI_PROJECTION = {"_id": 0, "id": 1, "location": 1}
+
+
+def road_approved_notification(road: dict) -> dict:
+    return build_notification(
+        road['user_id'],
+        "سکه دریافت شد!",
+        f"تبریک! مسیر '{road['road_name']}' شما تایید شد و {COINS_PER_APPROVED_ROAD} سکه مسیر به شما اضافه شد."
+    )
+
+
+def road_rejected_notification(road: dict) -> dict:
+    return build_notification(
+        road['user_id'],
+        "مسیر رد شد",
+        f"متاسفانه مسیر '{road['road_name']}' ثبت شده شما تایید نشد."
+    )
+
+
+# Only pending items can be moderated; approving also requires that no
+# coin was awarded yet, so a road can never pay out twice
+PENDING = {"status": "pending"}
+ROAD_APPROVAL_PENDING = {"status": "pending", "coin_awarded": {"$ne": True}}
+
+
+async def claim_one(collection, item_id: str, condition: dict, changes: dict, projection: dict, label: str) -> dict:
+    """
+    Conditionally change one item's status in a single find_one_and_update
+    Raises 404 when the item does not exist and 409 when it was already moderated
+    """
+    item = await collection.find_one_and_update(
+        {"id": item_id, **condition},
+        {"$set": changes},
+        projection=projection
+    )
+    if item is not None:
+        return item
+    if await collection.count_documents({"id": item_id}, limit=1):
+        raise HTTPException(status_code=409, detail=f"{label} قبلا بررسی شده است")
+    raise HTTPException(status_code=404, detail=f"{label} یافت نشد")
+
+
+async def finish_roads(approved: List[dict], rejected: List[dict]):
+    """
+    Apply the side effects of road status changes that were already claimed
+    One write per collection: simplified geometries, coin $inc, notifications, stats
+    """
+    writes = []
+
+    if approved:
+        writes.append(db.roads.bulk_write([
+            UpdateOne({"id": road['id']}, {"$set": {"simplified": simplify_levels(road['coordinates'])}})
+            for road in approved
+        ], ordered=False))
+
+        coins = Counter(road['user_id'] for road in approved)
+        writes.append(db.users.bulk_write([
+            UpdateOne({"id": user_id}, {"$inc": {"coins": count * COINS_PER_APPROVED_ROAD}})
+            for user_id, count in coins.items()
+        ], ordered=False))
+
+    notifications = [road_approved_notification(road) for road in approved]
+    notifications += [road_rejected_notification(road) for road in rejected]
+    writes.append(create_notifications(notifications))
+    writes.append(increment_stats(
+        roads_pending=-(len(approved) + len(rejected)),
+        roads_approved=len(approved),
+        roads_rejected=len(rejected),
+        total_coins=len(approved) * COINS_PER_APPROVED_ROAD,
+    ))
+
+    await asyncio.gather(*writes)
+    if approved or rejected:
+        await bump_versions("roads")
+
+    for road in approved:
+        invalidate_user(road['user_id'])
+    await tile_cache.invalidate(*[road['coordinates'] for road in approved])
+
+
+async def finish_pois(approved: List[dict], rejected: List[dict]):
+    """Apply the side effects of POI status changes that were already claimed"""
+    await increment_stats(
+        pois_pending=-(len(approved) + len(rejected)),
+        pois_approved=len(approved),
+        pois_rejected=len(rejected),
+    )
+    if approved or rejected:
+        await bump_versions("pois")
+    await tile_cache.invalidate(*[[poi['location']] for poi in approved])
+
+
+async def _claim(collection, ids: List[str], condition: dict, changes: dict, projection: dict) -> List[dict]:
+    """
+    Atomically change every item in ids that still matches condition and
+    return exactly the items this call changed, tagged by a one-off batch id
+    that is removed again once they are read
+    """
+    if not ids:
+        return []
+    batch_id = str(uuid.uuid4())
+    await collection.update_many(
+        {"id": {"$in": ids}, **condition},
+        {"$set": {**changes, "moderation_batch": batch_id}}
+    )
+    claimed = await collection.find({"id": {"$in": ids}, "moderation_batch": batch_id}, projection).to_list(None)
+    if claimed:
+        await collection.update_many({"moderation_batch": batch_id}, {"$unset": {"moderation_batch": ""}})
+    return claimed
+
+
+async def moderate_batch(
+    approve_roads: List[str],
+    reject_roads: List[str],
+    approve_pois: List[str],
+    reject_pois: List[str],
+) -> dict:
+    """
+    Approve/reject many roads and POIs at once
+    Items that are missing or no longer pending are reported as skipped
+    """
+    approved_roads, rejected_roads, approved_pois, rejected_pois = await asyncio.gather(
+        _claim(db.roads, approve_roads, ROAD_APPROVAL_PENDING, {"status": "approved", "coin_awarded": True}, ROAD_PROJECTION),
+        _claim(db.roads, reject_roads, PENDING, {"status": "rejected"}, ROAD_PROJECTION),
+        _claim(db.pois, approve_pois, PENDING, {"status": "approved"}, POI_PROJECTION),
+        _claim(db.pois, reject_pois, PENDING, {"status": "rejected"}, POI_PROJECTION),
+    )
+
+    await asyncio.gather(
+        finish_roads(approved_roads, rejected_roads),
+        finish_pois(approved_pois, rejected_pois),
+    )
+
+    def summary(approve_ids, reject_ids, approved, rejected):
+        done = {item['id'] for item in approved} | {item['id'] for item in rejected}
+        return {
+            "approved": [item['id'] for item in approved],
+            "rejected": [item['id'] for item in rejected],
+            "skipped": [item_id for item_id in (*approve_ids, *reject_ids) if item_id not in done],
+        }
+
+    result = {
+        "roads": summary(approve_roads, reject_roads, approved_roads, rejected_roads),
+        "pois": summary(approve_pois, reject_pois, approved_pois, rejected_pois),
+    }
+    logger.info(
+        f"Moderation batch: roads +{len(approved_roads)}/-{len(rejected_roads)}, "
+        f"pois +{len(approved_pois)}/-{len(rejected_pois)}"
+    )
+    return result
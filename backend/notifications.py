@@ -0,0 +1,106 @@
+"""
+Notification helpers for MASER backend
+Builds notification documents and queues them; a background worker writes
+them to MongoDB in batches and pushes them to the recipients' open
+notification streams
+"""
+import asyncio
+import time
+from typing import List
+import logging
+
+from pymongo.errors import BulkWriteError
+
+from config import NOTIFICATION_STREAM_HEARTBEAT_SECONDS, NOTIFICATION_STREAM_MAX_SECONDS
+from database import db, bump_versions, get_versions, DUPLICATE_KEY_ERROR
+from models import Notification
+from pubsub import notification_hub
+from responses import dumps
+from taskqueue import BatchQueue
+
+logger = logging.getLogger(__name__)
+
+
+def build_notification(user_id: str, title: str, message: str) -> dict:
+    """Build a notification document ready for insertion"""
+    return Notification(user_id=user_id, title=title, message=message).model_dump()
+
+
+def publish_notifications(notifications: List[dict]):
+    """Push stored notifications to their users' open streams (without the Mongo _id)"""
+    for notification in notifications:
+        notification_hub.publish(
+            notification['user_id'],
+            {key: value for key, value in notification.items() if key != '_id'}
+        )
+
+
+async def insert_notifications(notifications: List[dict]):
+    """
+    Store a batch of notifications, then push them and advance the users'
+    notification versions; raises on failure so the queue retries the batch
+    """
+    try:
+        await db.notifications.insert_many(notifications, ordered=False)
+    except BulkWriteError as e:
+        # A retried batch finds the notifications an earlier attempt stored
+        if any(err['code'] != DUPLICATE_KEY_ERROR for err in e.details.get('writeErrors', [])):
+            raise
+    publish_notifications(notifications)
+    await bump_versions(*{f"notifications:{n['user_id']}" for n in notifications})
+
+
+notification_queue = BatchQueue("notifications", insert_notifications)
+
+
+async def create_notification(user_id: str, title: str, message: str):
+    """Queue a notification; it is stored shortly after, in the background"""
+    await notification_queue.put(build_notification(user_id, title, message))
+
+
+async def create_notifications(notifications: List[dict]):
+    """Queue many pre-built notifications"""
+    await notification_queue.put_many(notifications)
+
+
+async def unread_count(user_id: str) -> int:
+    """Unread notifications of a user, counted on the (user_id, read) index"""
+    return await db.notifications.count_documents({"user_id": user_id, "read": False})
+
+
+def _event(name: str, data) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+async def notification_stream(user_id: str):
+    """
+    Server-Sent Events for one user: an `unread` count on connect, then a
+    `notification` event per new notification published on this worker
+    Each heartbeat re-checks the user's notification version, so changes
+    made on other workers still send a fresh `unread` count
+    """
+    queue = notification_hub.subscribe(user_id)
+    try:
+        deadline = time.monotonic() + NOTIFICATION_STREAM_MAX_SECONDS
+        version = await get_versions("notifications", f"notifications:{user_id}")
+        # Clients reconnect after the stream is closed; retry is in milliseconds
+        yield b"retry: 1000\n" + _event("unread", {"unread": await unread_count(user_id)})
+
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                notification = await asyncio.wait_for(
+                    queue.get(), min(NOTIFICATION_STREAM_HEARTBEAT_SECONDS, remaining)
+                )
+                yield _event("notification", notification)
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            current = await get_versions("notifications", f"notifications:{user_id}")
+            if current != version:
+                version = current
+                yield _event("unread", {"unread": await unread_count(user_id)})
+            else:
+                yield b": keep-alive\n\n"
+    finally:
+        notification_hub.unsubscribe(user_id, queue)
@@ -0,0 +1,69 @@
+"""
+Pagination helpers for MASER backend
+Opaque keyset cursors over (created_at, id) and cached collection counts
+"""
+import base64
+import json
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from config import COUNT_CACHE_TTL_SECONDS
+
+# Newest first; `id` breaks ties between documents created in the same instant
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+
+_count_cache = {}
+_COUNT_CACHE_MAX_KEYS = 1000
+
+
+def encode_cursor(doc: dict) -> str:
+    """Build an opaque cursor pointing just after the given document"""
+    raw = json.dumps([doc['created_at'].isoformat(), doc['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Turn a cursor into a query filter selecting the documents after it"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        created_at = datetime.fromisoformat(created_at)
+    except Exception:
+        raise HTTPException(status_code=400, detail="نشانگر صفحه نامعتبر است")
+
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": doc_id}},
+    ]}
+
+
+def next_cursor(items: List[dict], page_size: int) -> Optional[str]:
+    """Cursor for the following page, or None when this page is the last"""
+    if len(items) < page_size:
+        return None
+    return encode_cursor(items[-1])
+
+
+async def cached_count(collection, query: dict, version: str = "") -> int:
+    """
+    Count documents matching query, cached for a few seconds per query
+    Pass the collection's data version (the list ETag) so a write starts a
+    fresh count instead of pairing a new ETag with an old total.
+    Unfiltered counts use the collection metadata instead of scanning
+    """
+    key = (collection.name, version, json.dumps(query, sort_keys=True, default=str))
+    cached = _count_cache.get(key)
+    now = time.monotonic()
+    if cached and now - cached[0] < COUNT_CACHE_TTL_SECONDS:
+        return cached[1]
+
+    if query:
+        total = await collection.count_documents(query)
+    else:
+        total = await collection.estimated_document_count()
+    if len(_count_cache) >= _COUNT_CACHE_MAX_KEYS:
+        _count_cache.clear()
+    _count_cache[key] = (now, total)
+    return total
@@ -0,0 +1,60 @@
+"""
+Password hashing for MASER backend
+Runs bcrypt on a dedicated, size-limited thread pool so hashing never
+blocks the event loop, and rejects work quickly when the pool is saturated
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException
+
+from config import BCRYPT_ROUNDS, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending = 0
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+async def _run(func, *args):
+    """Run a bcrypt call on the pool, failing fast with 503 when the queue is full"""
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=503,
+            detail="سرور مشغول است. لطفا چند لحظه دیگر تلاش کنید.",
+            headers={"Retry-After": "1"}
+        )
+
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    """Hash password using bcrypt"""
+    return await _run(_hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    """Verify password against hash"""
+    return await _run(_verify, password, hashed)
+
+
+def pending_count() -> int:
+    """Number of password operations queued or running"""
+    return _pending
+
+
+def shutdown():
+    """Stop the hashing pool, waiting for in-flight work"""
+    _executor.shutdown(wait=True)
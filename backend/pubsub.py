@@ -0,0 +1,48 @@
+"""
+Pub/sub hub for MASER backend
+In-process fan-out of notification events to the user's open streams;
+publishing is a dict lookup and a queue put, so it is cheap for users
+with no open stream. Only streams connected to this worker are reached
+"""
+import asyncio
+from typing import Dict, Set
+import logging
+
+from config import NOTIFICATION_STREAM_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Hub:
+    """Per-user sets of bounded queues, one queue per open stream"""
+
+    def __init__(self, queue_size: int = NOTIFICATION_STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event: dict):
+        """Queue event on every stream of user_id; a full queue drops its oldest event"""
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                logger.warning("Notification stream of user %s is not keeping up; dropped an event", user_id)
+            queue.put_nowait(event)
+
+    def connection_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+notification_hub = Hub()
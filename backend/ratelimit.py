@@ -0,0 +1,136 @@
+"""
+Rate limiting backends for MASER backend
+Sliding-window counters with O(1) cost per request: each window keeps only
+the current and previous bucket counts, and the previous bucket is weighted
+by how much of it still overlaps the sliding window
+"""
+from abc import ABC, abstractmethod
+import math
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Tuple
+import logging
+
+from config import RATE_LIMIT_BACKEND, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_REDIS_URL
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: List[int]  # per configured limit, in order
+    exceeded: int  # index of the first exceeded limit, -1 when allowed
+
+
+def _weighted(previous: int, current: int, window: int, now: float) -> float:
+    elapsed = now - (now // window) * window
+    return previous * (1 - elapsed / window) + current
+
+
+class RateLimitBackend(ABC):
+    """Interface for rate limit stores; limits are (window_seconds, max_requests) pairs"""
+
+    @abstractmethod
+    async def hit(self, key: str, limits: List[Tuple[int, int]]) -> RateLimitResult:
+        """Count one request for key and report whether every limit still allows it"""
+
+    async def close(self):
+        pass
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Per-process store with a hard cap on tracked keys
+    Keys are kept in last-seen order, so idle keys are evicted from the
+    front in amortized O(1) and the oldest key goes first when full
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        # key -> (last_seen, [[bucket, current, previous], ...])
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _evict(self, now: float, idle_after: int):
+        while self._entries:
+            last_seen = next(iter(self._entries.values()))[0]
+            if now - last_seen < idle_after and len(self._entries) <= self.max_keys:
+                break
+            self._entries.popitem(last=False)
+
+    async def hit(self, key: str, limits: List[Tuple[int, int]]) -> RateLimitResult:
+        now = time.time()
+        entry = self._entries.pop(key, None)
+        states = entry[1] if entry else [[0, 0, 0] for _ in limits]
+
+        estimates = []
+        for (window, _), state in zip(limits, states):
+            bucket = int(now // window)
+            if state[0] != bucket:
+                state[2] = state[1] if state[0] == bucket - 1 else 0
+                state[1] = 0
+                state[0] = bucket
+            estimates.append(_weighted(state[2], state[1], window, now))
+
+        exceeded = next((i for i, ((_, limit), est) in enumerate(zip(limits, estimates)) if est >= limit), -1)
+        allowed = exceeded == -1
+        if allowed:
+            for state in states:
+                state[1] += 1
+
+        self._entries[key] = (now, states)
+        self._evict(now, max(window for window, _ in limits))
+
+        used = 1 if allowed else 0
+        remaining = [max(0, math.floor(limit - est) - used) for (_, limit), est in zip(limits, estimates)]
+        return RateLimitResult(allowed, remaining, exceeded)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Store shared by every worker through a Redis-compatible server
+    Buckets are plain counters that expire on their own, so memory stays
+    bounded without any sweeping; requires the optional `redis` package
+    """
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package") from e
+        self._redis = redis.from_url(url)
+
+    async def hit(self, key: str, limits: List[Tuple[int, int]]) -> RateLimitResult:
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        for window, _ in limits:
+            bucket = int(now // window)
+            current_key = f"rl:{key}:{window}:{bucket}"
+            pipe.incr(current_key)
+            pipe.expire(current_key, window * 2)
+            pipe.get(f"rl:{key}:{window}:{bucket - 1}")
+        replies = await pipe.execute()
+
+        remaining = []
+        exceeded = -1
+        for i, (window, limit) in enumerate(limits):
+            # The current request is already counted in `current`
+            current, previous = int(replies[i * 3]), int(replies[i * 3 + 2] or 0)
+            estimate = _weighted(previous, current - 1, window, now)
+            if estimate >= limit and exceeded == -1:
+                exceeded = i
+            remaining.append(max(0, math.floor(limit - estimate - 1)))
+        return RateLimitResult(exceeded == -1, remaining, exceeded)
+
+    async def close(self):
+        await self._redis.close()
+
+
+def create_backend() -> RateLimitBackend:
+    """Build the backend selected by RATE_LIMIT_BACKEND"""
+    if RATE_LIMIT_BACKEND == 'redis':
+        logger.info("Using Redis rate limit backend")
+        return RedisRateLimitBackend()
+    return MemoryRateLimitBackend()
@@ -0,0 +1,73 @@
+"""
+Response classes for MASER backend
+Fast JSON path for documents read from MongoDB: they were validated when
+written, so they are serialized directly instead of being re-validated
+against the endpoint's response_model and passed through jsonable_encoder
+"""
+import json
+from datetime import datetime, timezone
+from typing import Any, Optional, Type
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used without it
+    orjson = None
+
+
+def _default(obj: Any):
+    if isinstance(obj, datetime):
+        # MongoDB dates come back naive but are always UTC
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        # Same form Pydantic uses for UTC, so both response paths match
+        text = obj.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize trusted documents to UTF-8 JSON; naive datetimes are rendered as UTC"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+class DocumentResponse(JSONResponse):
+    """
+    JSON response for trusted MongoDB documents
+    Returning it from an endpoint bypasses response_model validation, so the
+    query projection must only select the fields the model would expose
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def model_projection(model: Type[BaseModel]) -> dict:
+    """MongoDB projection selecting exactly the fields of a response model"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+
+def _opaque_tag(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def not_modified(request: Request, etag: str, headers: Optional[dict] = None) -> Optional[Response]:
+    """304 response when the request's If-None-Match matches etag (weak comparison), else None"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return None
+    if header.strip() != '*' and _opaque_tag(etag) not in {_opaque_tag(tag) for tag in header.split(',')}:
+        return None
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
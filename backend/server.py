@@ -3,34 +3,62 @@ MASER Backend - Optimized Version
 A crowd-sourced mapping platform with advanced features
 Version: 2.0 - Production Ready
 """
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from responses import DocumentResponse, model_projection, not_modified
 from starlette.middleware.cors import CORSMiddleware
-from starlette.middleware.gzip import GZipMiddleware
 import logging
 from typing import Optional
 
 # Local imports
-from config import CORS_ORIGINS, JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_HOURS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, COINS_PER_APPROVED_ROAD
-from database import db, init_database, close_database, get_database_stats
-from middleware import RateLimitMiddleware, SecurityHeadersMiddleware, RequestLoggingMiddleware
+from config import (
+    CORS_ORIGINS, JWT_SECRET, JWT_ALGORITHM, JWT_EXPIRATION_HOURS, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+    DEFAULT_NEARBY_RADIUS_METERS, MAX_NEARBY_RADIUS_METERS, DEFAULT_NEARBY_LIMIT, MAX_NEARBY_LIMIT,
+    DEFAULT_BBOX_LIMIT, MAX_BBOX_LIMIT, TILE_MIN_ZOOM, TILE_MAX_ZOOM
+)
+from database import (
+    db, init_database, close_database, get_database_stats, increment_stats, record_status_change,
+    bump_versions, get_versions
+)
+from middleware import (
+    RateLimitMiddleware, SecurityHeadersMiddleware, GZipMiddleware, RequestLoggingMiddleware,
+    MetricsMiddleware, rate_limit_backend
+)
+import metrics
+from logging_config import setup_logging, stop_logging
+from geo import (
+    to_geojson_point, to_geojson_linestring, bbox_filter, simplification_level,
+    encode_polyline, line_bounds, polyline_roads, road_shape
+)
+from tiles import tile_cache, render_tile
+from pagination import KEYSET_SORT, decode_cursor, next_cursor, cached_count
+from cache import token_cache, user_cache
+from notifications import create_notification, notification_stream, unread_count
+from moderation import (
+    claim_one, finish_roads, finish_pois, moderate_batch,
+    PENDING, ROAD_APPROVAL_PENDING, ROAD_PROJECTION, POI_PROJECTION
+)
+from submissions import read_batch_items, submit_batch
+from duplicates import find_duplicate_road
+from export import MEDIA_TYPES as EXPORT_MEDIA_TYPES, export_query, stream_export
+from jobs import start_broadcast, get_job, cancel_jobs
+from taskqueue import drain_queues
+from passwords import hash_password, verify_password, shutdown as shutdown_password_pool
 from models import (
     User, UserCreate, UserLogin, TokenResponse,
     RoadSubmission, RoadSubmissionCreate,
     POI, POICreate,
     PersonalLocation, PersonalLocationCreate,
-    Notification, NotificationBroadcast,
+    Notification, NotificationBroadcast, NotificationsRead,
+    ModerationBatch,
     PaginatedResponse
 )
 from datetime import datetime, timezone, timedelta
-import bcrypt
 import jwt
+import time
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (records are written by a background thread)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app
@@ -45,18 +73,12 @@ app = FastAPI(
 # API Router with prefix
 api_router = APIRouter(prefix="/api")
 
-
-# ==================== Helper Functions ====================
-
-def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# List responses carry an ETag and must be revalidated before reuse
+LIST_CACHE_HEADERS = {"Cache-Control": "no-cache"}
+USER_CACHE_HEADERS = {"Cache-Control": "private, no-cache"}
 
 
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-
+# ==================== Helper Functions ====================
 
 def create_access_token(user_id: str) -> str:
     """Create JWT access token"""
@@ -80,29 +102,27 @@ def decode_token(token: str) -> dict:
 
 
 async def get_current_user(authorization: str = Header(None)) -> dict:
-    """Get current authenticated user"""
+    """
+    Get current authenticated user
+    Decoded tokens and user documents are served from in-process caches
+    """
     if not authorization or not authorization.startswith('Bearer '):
         raise HTTPException(status_code=401, detail="توکن نامعتبر است")
     
     token = authorization.replace('Bearer ', '')
-    payload = decode_token(token)
-    user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0})
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = decode_token(token)
+        token_cache.set(token, payload, ttl_seconds=payload["exp"] - time.time())
     
-    if not user:
-        raise HTTPException(status_code=401, detail="کاربر یافت نشد")
+    user = user_cache.get(payload["user_id"])
+    if user is None:
+        user = await db.users.find_one({"id": payload["user_id"]}, {"_id": 0, "password": 0})
+        if not user:
+            raise HTTPException(status_code=401, detail="کاربر یافت نشد")
+        user_cache.set(payload["user_id"], user)
     
-    return user
-
-
-async def create_notification(user_id: str, title: str, message: str):
-    """Helper function to create a notification"""
-    try:
-        notif = Notification(user_id=user_id, title=title, message=message)
-        notif_dict = notif.model_dump()
-        notif_dict['created_at'] = notif_dict['created_at'].isoformat()
-        await db.notifications.insert_one(notif_dict)
-    except Exception as e:
-        logger.error(f"Error creating notification: {e}")
+    return dict(user)
 
 
 # ==================== Authentication Routes ====================
@@ -122,13 +142,13 @@ async def register(user_data: UserCreate):
             raise HTTPException(status_code=400, detail="این ایمیل قبلا ثبت شده است")
         
         # Create user
-        hashed_pwd = hash_password(user_data.password)
+        hashed_pwd = await hash_password(user_data.password)
         user_obj = User(email=user_data.email, full_name=user_data.full_name)
         user_dict = user_obj.model_dump()
         user_dict['password'] = hashed_pwd
-        user_dict['created_at'] = user_dict['created_at'].isoformat()
         
         await db.users.insert_one(user_dict)
+        await increment_stats(users=1)
         
         # Create token
         token = create_access_token(user_obj.id)
@@ -152,7 +172,7 @@ async def login(credentials: UserLogin):
     """
     try:
         user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-        if not user or not verify_password(credentials.password, user['password']):
+        if not user or not await verify_password(credentials.password, user['password']):
             raise HTTPException(status_code=401, detail="ایمیل یا رمز عبور اشتباه است")
         
         token = create_access_token(user['id'])
@@ -185,8 +205,11 @@ async def submit_road(
     """
     Submit a new road
     - Requires authentication
-    - Coordinates must have at least 2 points
+    - Coordinates must have at least 2 points; they may instead be sent
+      as an encoded `polyline` string
     - Road will be pending until admin approval
+    - A road tracing the same street as an existing pending or approved
+      road is flagged with `duplicate_of` for the moderators
     """
     try:
         road_obj = RoadSubmission(
@@ -196,10 +219,26 @@ async def submit_road(
             coordinates=road_data.coordinates
         )
         
+        shape = road_shape(road_obj.coordinates)
+        try:
+            duplicate = await find_duplicate_road(shape)
+        except Exception as e:
+            # Advisory only; never block a submission on it
+            logger.warning(f"Duplicate road check failed: {e}")
+            duplicate = None
+        if duplicate:
+            road_obj.duplicate_of = duplicate['id']
+            logger.info(f"Road looks like a duplicate of {duplicate['id']} ({duplicate['distance']} m)")
+        
         road_dict = road_obj.model_dump()
-        road_dict['created_at'] = road_dict['created_at'].isoformat()
+        road_dict['geo'] = to_geojson_linestring(road_obj.coordinates)
+        road_dict['polyline'] = encode_polyline(road_obj.coordinates)
+        road_dict['shape'] = shape
+        road_dict['shape_bounds'] = line_bounds(shape)
         
         await db.roads.insert_one(road_dict)
+        await record_status_change('roads', None, road_obj.status)
+        await bump_versions("roads")
         
         # Create notification
         await create_notification(
@@ -219,66 +258,147 @@ async def submit_road(
 
 @api_router.get("/roads", tags=["Roads"])
 async def get_roads(
+    request: Request,
     status: Optional[str] = None,
     page: int = Query(1, ge=1),
-    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    format: str = Query("coordinates", pattern="^(coordinates|polyline)$")
 ):
     """
     Get list of roads with pagination
     - Filter by status (pending, approved, rejected)
-    - Paginated results
+    - Pass the returned `next_cursor` as `cursor` to fetch the next page
+      with a bounded index scan (`page` is then ignored)
+    - `include_total=false` skips counting; totals are cached briefly
+    - `format=polyline` returns each road's geometry as an encoded
+      `polyline` string instead of `coordinates`
+    - Sends an `ETag`; a matching `If-None-Match` gets 304 until roads change
     """
     try:
+        etag = await get_versions("roads")
+        cached = not_modified(request, etag, LIST_CACHE_HEADERS)
+        if cached:
+            return cached
+        
         query = {}
         if status:
             query['status'] = status
         
-        # Count total
-        total = await db.roads.count_documents(query)
-        
-        # Calculate pagination
-        skip = (page - 1) * page_size
-        total_pages = (total + page_size - 1) // page_size
-        
-        # Fetch roads
-        roads = await db.roads.find(query, {"_id": 0})\
-            .sort("created_at", -1)\
+        find_query = dict(query)
+        skip = 0
+        if cursor:
+            find_query.update(decode_cursor(cursor))
+        else:
+            skip = (page - 1) * page_size
+        
+        # Fetch roads; only the public fields, never internal bookkeeping
+        projection = model_projection(RoadSubmission)
+        if format == "polyline":
+            del projection["coordinates"]
+            projection["polyline"] = 1
+        roads = await db.roads.find(find_query, projection)\
+            .sort(KEYSET_SORT)\
             .skip(skip)\
             .limit(page_size)\
             .to_list(page_size)
         
-        # Convert datetime strings
-        for road in roads:
-            if isinstance(road['created_at'], str):
-                road['created_at'] = datetime.fromisoformat(road['created_at'])
+        cursor_out = next_cursor(roads, page_size)
+        
+        total = total_pages = None
+        if include_total:
+            total = await cached_count(db.roads, query, etag)
+            total_pages = (total + page_size - 1) // page_size
         
-        return {
+        return DocumentResponse({
             "items": roads,
             "total": total,
-            "page": page,
+            "page": None if cursor else page,
             "page_size": page_size,
-            "total_pages": total_pages
-        }
+            "total_pages": total_pages,
+            "next_cursor": cursor_out
+        }, headers={"ETag": etag, **LIST_CACHE_HEADERS})
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching roads: {e}")
         raise HTTPException(status_code=500, detail="خطا در دریافت مسیرها")
 
 
+@api_router.get("/roads/bbox", tags=["Roads"])
+async def get_roads_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lng: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lng: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22),
+    status: str = "approved",
+    limit: int = Query(DEFAULT_BBOX_LIMIT, ge=1, le=MAX_BBOX_LIMIT),
+    format: str = Query("coordinates", pattern="^(coordinates|polyline)$")
+):
+    """
+    Get roads intersecting a map viewport
+    - Uses the 2dsphere index on each road's GeoJSON line
+    - Approved roads are returned with geometry simplified for the zoom level
+    - `format=polyline` returns geometry as an encoded `polyline` string
+    """
+    if min_lat >= max_lat or min_lng >= max_lng:
+        raise HTTPException(status_code=400, detail="محدوده نقشه نامعتبر است")
+    
+    try:
+        query = {
+            **bbox_filter("$geoIntersects", min_lat, min_lng, max_lat, max_lng),
+            "status": status,
+        }
+        
+        level = simplification_level(zoom) if status == "approved" else None
+        projection = {
+            "_id": 0, "id": 1, "user_id": 1, "road_name": 1, "road_type": 1,
+            "status": 1, "coin_awarded": 1, "created_at": 1,
+        }
+        if level:
+            projection[f"simplified.{level}"] = 1
+        else:
+            projection["coordinates"] = 1
+        
+        roads = await db.roads.find(query, projection).limit(limit).to_list(limit)
+        
+        if level:
+            for road in roads:
+                road['coordinates'] = road.pop('simplified', {}).get(level, [])
+        if format == "polyline":
+            polyline_roads(roads)
+        
+        return DocumentResponse({"items": roads, "count": len(roads), "zoom": zoom})
+        
+    except Exception as e:
+        logger.error(f"Error fetching roads in bbox: {e}")
+        raise HTTPException(status_code=500, detail="خطا در دریافت مسیرها")
+
+
 @api_router.get("/roads/user", response_model=list[RoadSubmission], tags=["Roads"])
-async def get_user_roads(current_user: dict = Depends(get_current_user)):
-    """Get all roads submitted by current user"""
+async def get_user_roads(
+    format: str = Query("coordinates", pattern="^(coordinates|polyline)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get all roads submitted by current user
+    - `format=polyline` returns geometry as an encoded `polyline` string
+    """
     try:
+        projection = model_projection(RoadSubmission)
+        if format == "polyline":
+            del projection["coordinates"]
+            projection["polyline"] = 1
         roads = await db.roads.find(
             {"user_id": current_user['id']},
-            {"_id": 0}
+            projection
         ).sort("created_at", -1).to_list(1000)
         
-        for road in roads:
-            if isinstance(road['created_at'], str):
-                road['created_at'] = datetime.fromisoformat(road['created_at'])
-        
-        return roads
+        # Stored roads were validated on write; skip response_model re-validation
+        return DocumentResponse(roads)
         
     except Exception as e:
         logger.error(f"Error fetching user roads: {e}")
@@ -303,9 +423,11 @@ async def create_poi(
         )
         
         poi_dict = poi_obj.model_dump()
-        poi_dict['created_at'] = poi_dict['created_at'].isoformat()
+        poi_dict['geo'] = to_geojson_point(poi_obj.location)
         
         await db.pois.insert_one(poi_dict)
+        await record_status_change('pois', None, poi_obj.status)
+        await bump_versions("pois")
         
         logger.info(f"POI created by user {current_user['id']}: {poi_data.name}")
         
@@ -318,46 +440,196 @@ async def create_poi(
 
 @api_router.get("/pois", tags=["POIs"])
 async def get_pois(
+    request: Request,
     status: Optional[str] = None,
     category: Optional[str] = None,
     page: int = Query(1, ge=1),
-    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    page_size: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
-    """Get list of POIs with pagination and filters"""
+    """
+    Get list of POIs with pagination and filters
+    - Supports `cursor` / `next_cursor` keyset pagination like `GET /roads`
+    - Sends an `ETag`; a matching `If-None-Match` gets 304 until POIs change
+    """
     try:
+        etag = await get_versions("pois")
+        cached = not_modified(request, etag, LIST_CACHE_HEADERS)
+        if cached:
+            return cached
+        
         query = {}
         if status:
             query['status'] = status
         if category:
             query['category'] = category
         
-        total = await db.pois.count_documents(query)
-        skip = (page - 1) * page_size
-        total_pages = (total + page_size - 1) // page_size
+        find_query = dict(query)
+        skip = 0
+        if cursor:
+            find_query.update(decode_cursor(cursor))
+        else:
+            skip = (page - 1) * page_size
         
-        pois = await db.pois.find(query, {"_id": 0})\
-            .sort("created_at", -1)\
+        pois = await db.pois.find(find_query, model_projection(POI))\
+            .sort(KEYSET_SORT)\
             .skip(skip)\
             .limit(page_size)\
             .to_list(page_size)
         
-        for poi in pois:
-            if isinstance(poi['created_at'], str):
-                poi['created_at'] = datetime.fromisoformat(poi['created_at'])
+        cursor_out = next_cursor(pois, page_size)
+        
+        total = total_pages = None
+        if include_total:
+            total = await cached_count(db.pois, query, etag)
+            total_pages = (total + page_size - 1) // page_size
         
-        return {
+        return DocumentResponse({
             "items": pois,
             "total": total,
-            "page": page,
+            "page": None if cursor else page,
             "page_size": page_size,
-            "total_pages": total_pages
-        }
+            "total_pages": total_pages,
+            "next_cursor": cursor_out
+        }, headers={"ETag": etag, **LIST_CACHE_HEADERS})
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching POIs: {e}")
         raise HTTPException(status_code=500, detail="خطا در دریافت مکان‌ها")
 
 
+@api_router.get("/pois/nearby", tags=["POIs"])
+async def get_nearby_pois(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: int = Query(DEFAULT_NEARBY_RADIUS_METERS, ge=1, le=MAX_NEARBY_RADIUS_METERS),
+    limit: int = Query(DEFAULT_NEARBY_LIMIT, ge=1, le=MAX_NEARBY_LIMIT),
+    status: Optional[str] = None,
+    category: Optional[str] = None
+):
+    """
+    Get POIs around a point, nearest first
+    - radius in meters
+    - Each item includes its `distance` in meters
+    - Served by the 2dsphere index on `geo`
+    """
+    try:
+        query = {}
+        if status:
+            query['status'] = status
+        if category:
+            query['category'] = category
+        
+        pipeline = [
+            {"$geoNear": {
+                "near": to_geojson_point([lat, lng]),
+                "distanceField": "distance",
+                "maxDistance": radius,
+                "query": query,
+                "spherical": True,
+            }},
+            {"$limit": limit},
+            {"$project": {**model_projection(POI), "distance": 1}},
+        ]
+        pois = await db.pois.aggregate(pipeline).to_list(limit)
+        
+        return DocumentResponse({"items": pois, "count": len(pois)})
+        
+    except Exception as e:
+        logger.error(f"Error fetching nearby POIs: {e}")
+        raise HTTPException(status_code=500, detail="خطا در دریافت مکان‌های نزدیک")
+
+
+# ==================== Batch Submission Routes ====================
+
+@api_router.post("/submissions/batch", tags=["Roads", "POIs"])
+async def submit_batch_items(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Upload many roads and POIs collected offline in one request
+    - Body: JSON array, or NDJSON with `Content-Type: application/x-ndjson`
+    - Each item has `type` ("road" or "poi"), the usual submission fields
+      and an optional `idempotency_key`; retried keys are reported as duplicates
+    - Returns a result (created / duplicate / invalid) per item, in order
+    """
+    items = await read_batch_items(request)
+    
+    try:
+        return await submit_batch(current_user['id'], items)
+        
+    except Exception as e:
+        logger.error(f"Error submitting batch: {e}")
+        raise HTTPException(status_code=500, detail="خطا در ثبت گروهی")
+
+
+# ==================== Vector Tile Routes ====================
+
+@api_router.get("/tiles/{z}/{x}/{y}.mvt", tags=["Tiles"])
+async def get_tile(z: int, x: int, y: int):
+    """
+    Get a Mapbox Vector Tile of approved roads and POIs
+    - Layers: `roads` (lines) and `pois` (points)
+    - Rendered once per tile and served from the tile cache until
+      an approval or rejection touches it
+    """
+    if not (TILE_MIN_ZOOM <= z <= TILE_MAX_ZOOM) or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="کاشی یافت نشد")
+    
+    try:
+        tile = await tile_cache.get(z, x, y)
+        if tile is None:
+            generation = await tile_cache.generation()
+            tile = await render_tile(db, z, x, y)
+            await tile_cache.put(z, x, y, tile, generation)
+        
+        return Response(content=tile, media_type="application/vnd.mapbox-vector-tile")
+        
+    except Exception as e:
+        logger.error(f"Error rendering tile {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail="خطا در دریافت کاشی نقشه")
+
+
+# ==================== Export Routes ====================
+
+@api_router.get("/export", tags=["Export"])
+async def export_map(
+    format: str = Query("geojson", pattern="^(geojson|ndjson)$"),
+    type: Optional[str] = Query(None, pattern="^(road|poi)$"),
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180),
+    since: Optional[datetime] = None
+):
+    """
+    Export approved roads and POIs as GeoJSON features
+    - `format=geojson` streams one FeatureCollection, `format=ndjson`
+      one Feature per line
+    - `type` limits the export to `road` or `poi`
+    - Optional bounding box (all four bounds) and `since` (features
+      submitted at or after this time)
+    - Streamed from a database cursor, so any size can be exported
+    """
+    bounds = (min_lat, min_lng, max_lat, max_lng)
+    if any(b is not None for b in bounds):
+        if any(b is None for b in bounds) or min_lat >= max_lat or min_lng >= max_lng:
+            raise HTTPException(status_code=400, detail="محدوده نقشه نامعتبر است")
+    else:
+        bounds = None
+    
+    kinds = [type] if type else ["road", "poi"]
+    return StreamingResponse(
+        stream_export(export_query(bounds, since), kinds, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="maser-export.{format}"'}
+    )
+
+
 # ==================== Personal Location Routes ====================
 
 @api_router.post("/locations/personal", response_model=PersonalLocation, tags=["Personal Locations"])
@@ -374,7 +646,6 @@ async def create_personal_location(
         )
         
         loc_dict = loc_obj.model_dump()
-        loc_dict['created_at'] = loc_dict['created_at'].isoformat()
         
         await db.personal_locations.insert_one(loc_dict)
         
@@ -391,14 +662,10 @@ async def get_personal_locations(current_user: dict = Depends(get_current_user))
     try:
         locations = await db.personal_locations.find(
             {"user_id": current_user['id']},
-            {"_id": 0}
+            model_projection(PersonalLocation)
         ).sort("created_at", -1).to_list(100)
         
-        for loc in locations:
-            if isinstance(loc['created_at'], str):
-                loc['created_at'] = datetime.fromisoformat(loc['created_at'])
-        
-        return locations
+        return DocumentResponse(locations)
         
     except Exception as e:
         logger.error(f"Error fetching personal locations: {e}")
@@ -408,25 +675,123 @@ async def get_personal_locations(current_user: dict = Depends(get_current_user))
 # ==================== Notification Routes ====================
 
 @api_router.get("/notifications", response_model=list[Notification], tags=["Notifications"])
-async def get_notifications(current_user: dict = Depends(get_current_user)):
-    """Get all notifications for current user"""
+async def get_notifications(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Get notifications for current user, newest first
+    - When more are available the `X-Next-Cursor` response header
+      holds the `cursor` for the next page
+    - Sends an `ETag`; a matching `If-None-Match` gets 304 until the
+      user's notifications change
+    """
     try:
+        etag = await get_versions("notifications", f"notifications:{current_user['id']}")
+        cached = not_modified(request, etag, USER_CACHE_HEADERS)
+        if cached:
+            return cached
+        
+        query = {"user_id": current_user['id']}
+        if cursor:
+            query.update(decode_cursor(cursor))
+        
         notifications = await db.notifications.find(
-            {"user_id": current_user['id']},
-            {"_id": 0}
-        ).sort("created_at", -1).limit(100).to_list(100)
+            query,
+            model_projection(Notification)
+        ).sort(KEYSET_SORT).limit(limit).to_list(limit)
         
-        for notif in notifications:
-            if isinstance(notif['created_at'], str):
-                notif['created_at'] = datetime.fromisoformat(notif['created_at'])
+        cursor_out = next_cursor(notifications, limit)
+        headers = {"ETag": etag, **USER_CACHE_HEADERS}
+        if cursor_out:
+            headers['X-Next-Cursor'] = cursor_out
         
-        return notifications
+        return DocumentResponse(notifications, headers=headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching notifications: {e}")
         raise HTTPException(status_code=500, detail="خطا در دریافت اعلان‌ها")
 
 
+@api_router.get("/notifications/unread-count", tags=["Notifications"])
+async def get_unread_count(
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Number of unread notifications of the current user
+    - Cheaper than polling `GET /notifications`; also sends an `ETag`
+    """
+    try:
+        etag = await get_versions("notifications", f"notifications:{current_user['id']}")
+        cached = not_modified(request, etag, USER_CACHE_HEADERS)
+        if cached:
+            return cached
+        
+        return JSONResponse(
+            {"unread": await unread_count(current_user['id'])},
+            headers={"ETag": etag, **USER_CACHE_HEADERS}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error counting unread notifications: {e}")
+        raise HTTPException(status_code=500, detail="خطا در دریافت اعلان‌ها")
+
+
+@api_router.get("/notifications/stream", tags=["Notifications"])
+async def stream_notifications(current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events stream of the current user's notifications
+    - `unread` event with `{"unread": n}` on connect and whenever the count
+      may have changed; `notification` event for each new notification
+    - The server closes the stream every few minutes; reconnect (EventSource
+      does so automatically) and keep the last count
+    """
+    return StreamingResponse(
+        notification_stream(current_user['id']),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@api_router.put("/notifications/read", tags=["Notifications"])
+async def mark_notifications_read(
+    data: NotificationsRead,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Mark many notifications as read in one update
+    - `ids` lists the notifications to mark; omit it to mark all of them
+    - Returns the number of notifications that changed
+    """
+    try:
+        query = {"user_id": current_user['id'], "read": False}
+        if data.ids is not None:
+            query["id"] = {"$in": data.ids}
+        
+        result = await db.notifications.update_many(
+            query,
+            {"$set": {"read": True, "read_at": datetime.now(timezone.utc)}}
+        )
+        
+        if result.modified_count:
+            await bump_versions(f"notifications:{current_user['id']}")
+        
+        return {"message": "اعلان‌ها خوانده شدند", "updated": result.modified_count}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error marking notifications as read: {e}")
+        raise HTTPException(status_code=500, detail="خطا در به‌روزرسانی اعلان")
+
+
 @api_router.put("/notifications/{notification_id}/read", tags=["Notifications"])
 async def mark_notification_read(
     notification_id: str,
@@ -436,12 +801,14 @@ async def mark_notification_read(
     try:
         result = await db.notifications.update_one(
             {"id": notification_id, "user_id": current_user['id']},
-            {"$set": {"read": True}}
+            {"$set": {"read": True, "read_at": datetime.now(timezone.utc)}}
         )
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="اعلان یافت نشد")
         
+        await bump_versions(f"notifications:{current_user['id']}")
+        
         return {"message": "اعلان خوانده شد"}
         
     except HTTPException:
@@ -457,32 +824,16 @@ async def mark_notification_read(
 async def approve_road(road_id: str):
     """
     Approve a road submission
+    - Only pending roads can be approved (409 otherwise)
     - Awards coin to user
     - Sends notification
     """
     try:
-        road = await db.roads.find_one({"id": road_id})
-        if not road:
-            raise HTTPException(status_code=404, detail="مسیر یافت نشد")
-        
-        # Update road status
-        await db.roads.update_one(
-            {"id": road_id},
-            {"$set": {"status": "approved", "coin_awarded": True}}
-        )
-        
-        # Award coin to user
-        await db.users.update_one(
-            {"id": road['user_id']},
-            {"$inc": {"coins": COINS_PER_APPROVED_ROAD}}
-        )
-        
-        # Send notification
-        await create_notification(
-            road['user_id'],
-            "سکه دریافت شد!",
-            f"تبریک! مسیر '{road['road_name']}' شما تایید شد و {COINS_PER_APPROVED_ROAD} سکه مسیر به شما اضافه شد."
+        road = await claim_one(
+            db.roads, road_id, ROAD_APPROVAL_PENDING,
+            {"status": "approved", "coin_awarded": True}, ROAD_PROJECTION, "مسیر"
         )
+        await finish_roads(approved=[road], rejected=[])
         
         logger.info(f"Road approved: {road_id}")
         
@@ -497,23 +848,12 @@ async def approve_road(road_id: str):
 
 @api_router.put("/admin/roads/{road_id}/reject", tags=["Admin"])
 async def reject_road(road_id: str):
-    """Reject a road submission"""
+    """Reject a pending road submission"""
     try:
-        road = await db.roads.find_one({"id": road_id})
-        if not road:
-            raise HTTPException(status_code=404, detail="مسیر یافت نشد")
-        
-        await db.roads.update_one(
-            {"id": road_id},
-            {"$set": {"status": "rejected"}}
-        )
-        
-        # Send notification
-        await create_notification(
-            road['user_id'],
-            "مسیر رد شد",
-            f"متاسفانه مسیر '{road['road_name']}' ثبت شده شما تایید نشد."
+        road = await claim_one(
+            db.roads, road_id, PENDING, {"status": "rejected"}, ROAD_PROJECTION, "مسیر"
         )
+        await finish_roads(approved=[], rejected=[road])
         
         logger.info(f"Road rejected: {road_id}")
         
@@ -528,16 +868,12 @@ async def reject_road(road_id: str):
 
 @api_router.put("/admin/pois/{poi_id}/approve", tags=["Admin"])
 async def approve_poi(poi_id: str):
-    """Approve a POI submission"""
+    """Approve a pending POI submission"""
     try:
-        poi = await db.pois.find_one({"id": poi_id})
-        if not poi:
-            raise HTTPException(status_code=404, detail="مکان یافت نشد")
-        
-        await db.pois.update_one(
-            {"id": poi_id},
-            {"$set": {"status": "approved"}}
+        poi = await claim_one(
+            db.pois, poi_id, PENDING, {"status": "approved"}, POI_PROJECTION, "مکان"
         )
+        await finish_pois(approved=[poi], rejected=[])
         
         logger.info(f"POI approved: {poi_id}")
         
@@ -552,16 +888,12 @@ async def approve_poi(poi_id: str):
 
 @api_router.put("/admin/pois/{poi_id}/reject", tags=["Admin"])
 async def reject_poi(poi_id: str):
-    """Reject a POI submission"""
+    """Reject a pending POI submission"""
     try:
-        poi = await db.pois.find_one({"id": poi_id})
-        if not poi:
-            raise HTTPException(status_code=404, detail="مکان یافت نشد")
-        
-        await db.pois.update_one(
-            {"id": poi_id},
-            {"$set": {"status": "rejected"}}
+        poi = await claim_one(
+            db.pois, poi_id, PENDING, {"status": "rejected"}, POI_PROJECTION, "مکان"
         )
+        await finish_pois(approved=[], rejected=[poi])
         
         logger.info(f"POI rejected: {poi_id}")
         
@@ -574,24 +906,41 @@ async def reject_poi(poi_id: str):
         raise HTTPException(status_code=500, detail="خطا در رد مکان")
 
 
+@api_router.post("/admin/moderate", tags=["Admin"])
+async def moderate(data: ModerationBatch):
+    """
+    Approve and reject many roads and POIs in one request
+    - Each id is applied only if the item is still pending
+    - Returns approved/rejected/skipped ids per collection
+    """
+    try:
+        return await moderate_batch(
+            data.approve_roads, data.reject_roads,
+            data.approve_pois, data.reject_pois
+        )
+    except Exception as e:
+        logger.error(f"Error moderating batch: {e}")
+        raise HTTPException(status_code=500, detail="خطا در بررسی گروهی")
+
+
 @api_router.post("/admin/notifications/broadcast", tags=["Admin"])
 async def broadcast_notification(data: NotificationBroadcast):
     """
     Broadcast notification to all users or specific user
     - userId: "all" for all users, or specific user ID
+    - Broadcasts to all users run in the background; poll
+      `/admin/jobs/{job_id}` with the returned `job_id` for progress
     """
     try:
         if data.userId == "all":
-            # Send to all users
-            users = await db.users.find({}, {"_id": 0, "id": 1}).to_list(10000)
-            for user in users:
-                await create_notification(user['id'], data.title, data.message)
-            
-            logger.info(f"Broadcast notification sent to {len(users)} users")
-        else:
-            # Send to specific user
-            await create_notification(data.userId, data.title, data.message)
-            logger.info(f"Notification sent to user: {data.userId}")
+            # Send to all users in the background
+            job_id = await start_broadcast(data.title, data.message)
+            logger.info(f"Broadcast notification job started: {job_id}")
+            return {"message": "ارسال اعلان آغاز شد", "job_id": job_id}
+        
+        # Send to specific user
+        await create_notification(data.userId, data.title, data.message)
+        logger.info(f"Notification sent to user: {data.userId}")
         
         return {"message": "اعلان ارسال شد"}
         
@@ -600,11 +949,31 @@ async def broadcast_notification(data: NotificationBroadcast):
         raise HTTPException(status_code=500, detail="خطا در ارسال اعلان")
 
 
+@api_router.get("/admin/jobs/{job_id}", tags=["Admin"])
+async def get_job_status(job_id: str):
+    """Get progress of a background job (e.g. a broadcast)"""
+    try:
+        job = await get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="کار یافت نشد")
+        return DocumentResponse(job)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching job status: {e}")
+        raise HTTPException(status_code=500, detail="خطا در دریافت وضعیت کار")
+
+
 @api_router.get("/admin/stats", tags=["Admin"])
-async def get_admin_stats():
-    """Get admin dashboard statistics"""
+async def get_admin_stats(refresh: bool = False):
+    """
+    Get admin dashboard statistics
+    - Served from incrementally maintained counters (cached for a few seconds)
+    - `refresh=true` recomputes them from the collections
+    """
     try:
-        stats = await get_database_stats()
+        stats = await get_database_stats(refresh=refresh)
         return stats
     except Exception as e:
         logger.error(f"Error fetching admin stats: {e}")
@@ -640,6 +1009,17 @@ async def health_check():
     }
 
 
+@api_router.get("/metrics", tags=["Health"])
+async def get_metrics():
+    """
+    Metrics in the Prometheus text format
+    - Per-route request counts and latency histograms, in-flight requests
+    - Rate limit rejections, MongoDB pool usage, cache hit/miss counts
+    - Values are per worker process
+    """
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 # ==================== Application Setup ====================
 
 # Include API router
@@ -649,6 +1029,7 @@ app.include_router(api_router)
 app.add_middleware(GZipMiddleware, minimum_size=1000)  # Compress responses
 app.add_middleware(SecurityHeadersMiddleware)  # Security headers
 app.add_middleware(RequestLoggingMiddleware)  # Logging
+app.add_middleware(MetricsMiddleware)  # Request metrics
 app.add_middleware(RateLimitMiddleware)  # Rate limiting
 
 # CORS middleware (must be last)
@@ -673,8 +1054,13 @@ async def startup_event():
 async def shutdown_event():
     """Cleanup on shutdown"""
     logger.info("Shutting down MASER API...")
+    await cancel_jobs()
+    await drain_queues()
     await close_database()
+    shutdown_password_pool()
+    await rate_limit_backend.close()
     logger.info("MASER API stopped")
+    stop_logging()
 
 
 # Global exception handler
@@ -0,0 +1,199 @@
+"""
+Batch submissions for MASER backend
+Lets field surveyors upload many offline-collected roads and POIs at once:
+items are validated individually, written with one insert_many per
+collection, and de-duplicated by client-supplied idempotency keys. Roads
+also get the same advisory near-duplicate check as single submissions
+"""
+import asyncio
+import json
+from typing import List, Optional
+import logging
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from config import MAX_BATCH_SUBMISSION_ITEMS
+from database import db, increment_stats, bump_versions, DUPLICATE_KEY_ERROR
+from duplicates import find_duplicate_in, find_duplicate_road
+from geo import encode_polyline, line_bounds, road_shape, to_geojson_linestring, to_geojson_point
+from models import RoadSubmission, RoadSubmissionCreate, POI, POICreate
+from notifications import create_notification
+
+logger = logging.getLogger(__name__)
+
+
+async def read_batch_items(request: Request) -> List:
+    """
+    Read a batch body: a JSON array, or NDJSON (one item per line) when sent
+    as application/x-ndjson; NDJSON is parsed line by line as it streams in
+    """
+    content_type = request.headers.get('content-type', '')
+    items = []
+
+    def add(item):
+        if len(items) >= MAX_BATCH_SUBMISSION_ITEMS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"تعداد موارد نباید بیشتر از {MAX_BATCH_SUBMISSION_ITEMS} باشد"
+            )
+        items.append(item)
+
+    try:
+        if 'ndjson' in content_type:
+            buffer = b""
+            async for chunk in request.stream():
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        add(json.loads(line))
+            if buffer.strip():
+                add(json.loads(buffer))
+        else:
+            body = json.loads(await request.body())
+            if not isinstance(body, list):
+                raise ValueError("expected a JSON array")
+            for item in body:
+                add(item)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="قالب داده‌های ارسالی نامعتبر است")
+
+    return items
+
+
+def _build_document(user_id: str, item) -> dict:
+    """Validate one item and build the document to insert; raises ValueError/ValidationError"""
+    if not isinstance(item, dict):
+        raise ValueError("هر مورد باید یک شیء JSON باشد")
+
+    # Only the client-writable fields are taken from the item
+    kind = item.get('type')
+    if kind == 'road':
+        data = RoadSubmissionCreate(**item)
+        doc = RoadSubmission(user_id=user_id, **data.model_dump()).model_dump()
+        doc['geo'] = to_geojson_linestring(doc['coordinates'])
+        doc['polyline'] = encode_polyline(doc['coordinates'])
+        doc['shape'] = road_shape(doc['coordinates'])
+        doc['shape_bounds'] = line_bounds(doc['shape'])
+    elif kind == 'poi':
+        data = POICreate(**item)
+        doc = POI(user_id=user_id, **data.model_dump()).model_dump()
+        doc['geo'] = to_geojson_point(doc['location'])
+    else:
+        raise ValueError("نوع مورد باید 'road' یا 'poi' باشد")
+
+    key = item.get('idempotency_key')
+    if key is not None:
+        doc['idempotency_key'] = str(key)
+    return doc
+
+
+def _error_messages(error: Exception) -> List[str]:
+    if isinstance(error, ValidationError):
+        return [f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in error.errors()]
+    return [str(error)]
+
+
+async def _existing_keys(collection, user_id: str, keys: List[str]) -> dict:
+    """Map idempotency key -> id of documents this user already uploaded"""
+    if not keys:
+        return {}
+    cursor = collection.find(
+        {"user_id": user_id, "idempotency_key": {"$in": keys}},
+        {"_id": 0, "id": 1, "idempotency_key": 1}
+    )
+    return {doc['idempotency_key']: doc['id'] async for doc in cursor}
+
+
+async def _insert(collection, docs: List[dict]) -> set:
+    """Insert docs unordered; returns indexes (into docs) rejected as duplicate keys"""
+    if not docs:
+        return set()
+    try:
+        await collection.insert_many(docs, ordered=False)
+        return set()
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if any(err['code'] != DUPLICATE_KEY_ERROR for err in errors):
+            raise
+        return {err['index'] for err in errors}
+
+
+async def _mark_duplicate_roads(docs: List[dict]):
+    """
+    Set `duplicate_of` on road documents that trace a stored road or an
+    earlier road of the same batch (offline uploads often repeat a street).
+    Advisory only: a failed check never blocks the upload
+    """
+    checks = await asyncio.gather(*(find_duplicate_road(doc['shape']) for doc in docs), return_exceptions=True)
+    for position, (doc, stored) in enumerate(zip(docs, checks)):
+        if isinstance(stored, Exception):
+            logger.warning(f"Duplicate road check failed: {stored}")
+            stored = None
+        earlier = find_duplicate_in(doc['shape'], docs[:position])
+        duplicate = min(filter(None, (stored, earlier)), key=lambda match: match['distance'], default=None)
+        if duplicate:
+            doc['duplicate_of'] = duplicate['id']
+
+
+async def submit_batch(user_id: str, items: List) -> dict:
+    """Validate, de-duplicate and insert a batch; returns per-item results"""
+    results: List[Optional[dict]] = [None] * len(items)
+    pending = {'road': [], 'poi': []}  # (item index, document)
+
+    for index, item in enumerate(items):
+        key = item.get('idempotency_key') if isinstance(item, dict) else None
+        try:
+            doc = _build_document(user_id, item)
+        except (ValidationError, ValueError, TypeError) as e:
+            results[index] = {"index": index, "idempotency_key": key, "status": "invalid", "errors": _error_messages(e)}
+            continue
+        pending[item['type']].append((index, doc))
+
+    counts = {'road': 0, 'poi': 0}
+    for kind, collection in (('road', db.roads), ('poi', db.pois)):
+        # Drop items whose key was already uploaded, or repeated within this batch
+        existing = await _existing_keys(
+            collection, user_id, [doc['idempotency_key'] for _, doc in pending[kind] if 'idempotency_key' in doc]
+        )
+        to_insert = []
+        for index, doc in pending[kind]:
+            key = doc.get('idempotency_key')
+            if key is not None and key in existing:
+                results[index] = {"index": index, "idempotency_key": key, "status": "duplicate", "id": existing[key]}
+                continue
+            if key is not None:
+                existing[key] = doc['id']
+            to_insert.append((index, doc))
+        if kind == 'road':
+            await _mark_duplicate_roads([doc for _, doc in to_insert])
+
+        # A concurrent retry can still win the race; the unique index catches it
+        rejected = await _insert(collection, [doc for _, doc in to_insert])
+        for position, (index, doc) in enumerate(to_insert):
+            key = doc.get('idempotency_key')
+            if position in rejected:
+                results[index] = {"index": index, "idempotency_key": key, "status": "duplicate", "id": None}
+            else:
+                results[index] = {"index": index, "idempotency_key": key, "status": "created", "id": doc['id']}
+                counts[kind] += 1
+
+    await increment_stats(roads_pending=counts['road'], pois_pending=counts['poi'])
+    await bump_versions(*[f"{kind}s" for kind, count in counts.items() if count])
+
+    if counts['road'] or counts['poi']:
+        await create_notification(
+            user_id,
+            "ارسال گروهی ثبت شد",
+            f"{counts['road']} مسیر و {counts['poi']} مکان با موفقیت ثبت شد و پس از بررسی تایید خواهند شد."
+        )
+
+    logger.info(f"Batch submitted by user {user_id}: {counts['road']} roads, {counts['poi']} POIs")
+
+    return {
+        "created_roads": counts['road'],
+        "created_pois": counts['poi'],
+        "results": results,
+    }
@@ -0,0 +1,113 @@
+"""
+Background task queue for MASER backend
+Side effects of write requests (such as notifications) are queued in
+process and written in batches by one asyncio worker per queue, so the
+request only waits for its primary write. Failed batches are retried;
+queued items are flushed on shutdown
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List
+import logging
+
+from config import (
+    TASK_QUEUE_MAX_SIZE, TASK_QUEUE_BATCH_SIZE, TASK_QUEUE_RETRIES,
+    TASK_QUEUE_RETRY_DELAY_SECONDS, TASK_QUEUE_DRAIN_SECONDS
+)
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+QUEUES: Dict[str, "BatchQueue"] = {}
+
+Gauge(
+    "maser_task_queue_depth", "Items waiting in a background task queue", ("queue",),
+    callback=lambda: {(name,): queue.depth() for name, queue in QUEUES.items()}
+)
+task_queue_dropped = Counter(
+    "maser_task_queue_dropped_total", "Items dropped after every retry failed", ("queue",)
+)
+
+
+class BatchQueue:
+    """
+    Bounded queue whose items are passed to handler in batches of up to
+    batch_size; enqueueing waits while the queue is full. The worker task
+    starts with the first item, so it always runs on the serving event loop
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[List], Awaitable[None]],
+        max_size: int = TASK_QUEUE_MAX_SIZE,
+        batch_size: int = TASK_QUEUE_BATCH_SIZE,
+        retries: int = TASK_QUEUE_RETRIES,
+        retry_delay: float = TASK_QUEUE_RETRY_DELAY_SECONDS,
+    ):
+        self.name = name
+        self.handler = handler
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue = None
+        self._worker = None
+        QUEUES[name] = self
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _start(self):
+        if self._worker is None:
+            self._queue = self._queue or asyncio.Queue(self.max_size)
+            self._worker = asyncio.create_task(self._run())
+
+    async def put(self, item):
+        self._start()
+        await self._queue.put(item)
+
+    async def put_many(self, items: Iterable):
+        self._start()
+        for item in items:
+            await self._queue.put(item)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._handle(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _handle(self, batch: List):
+        for attempt in range(1, self.retries + 1):
+            try:
+                await self.handler(batch)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    task_queue_dropped.inc(self.name, amount=len(batch))
+                    logger.error(f"Dropped {len(batch)} {self.name} tasks after {attempt} attempts: {e}")
+                    return
+                logger.warning(f"{self.name} batch of {len(batch)} failed (attempt {attempt}), retrying: {e}")
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    async def drain(self, timeout: float = TASK_QUEUE_DRAIN_SECONDS):
+        """Wait up to timeout for queued items to be handled, then stop the worker"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"{self._queue.qsize()} {self.name} tasks were not handled before shutdown")
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+
+
+async def drain_queues():
+    """Flush every task queue; called on shutdown before the database is closed"""
+    await asyncio.gather(*(queue.drain() for queue in QUEUES.values()))
@@ -0,0 +1,372 @@
+"""
+Vector tile rendering and caching for MASER backend
+Renders approved roads and POIs into Mapbox Vector Tiles (MVT)
+and keeps rendered tiles in an on-disk cache fronted by an in-memory LRU
+"""
+import asyncio
+import math
+import os
+import struct
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+from config import TILE_CACHE_DIR, TILE_MEMORY_CACHE_SIZE, TILE_EXTENT, TILE_BUFFER, TILE_MIN_ZOOM, TILE_MAX_ZOOM
+from geo import bbox_filter, simplification_level
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# ==================== Tile Math ====================
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (min_lat, min_lng, max_lat, max_lng) of a web-mercator tile"""
+    n = 2 ** z
+    min_lng = x / n * 360.0 - 180.0
+    max_lng = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def _mercator(lat: float, lng: float, z: int) -> Tuple[float, float]:
+    """Project lat/lng to fractional tile coordinates at zoom z"""
+    lat = max(min(lat, 85.0511), -85.0511)
+    n = 2 ** z
+    fx = (lng + 180.0) / 360.0 * n
+    fy = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+    return fx, fy
+
+
+def tile_range(
+    z: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float, buffer: float = 0.0
+) -> Tuple[int, int, int, int]:
+    """
+    Return inclusive (min_x, min_y, max_x, max_y) of tiles covering a bounding box
+    `buffer` (a fraction of a tile) also takes in tiles whose padded area reaches it
+    """
+    n = 2 ** z
+    x0, y0 = _mercator(max_lat, min_lng, z)
+    x1, y1 = _mercator(min_lat, max_lng, z)
+    clamp = lambda v: max(0, min(n - 1, math.floor(v)))
+    return clamp(x0 - buffer), clamp(y0 - buffer), clamp(x1 + buffer), clamp(y1 + buffer)
+
+
+def coordinates_bbox(coordinates: Iterable[List[float]]) -> Tuple[float, float, float, float]:
+    """Return (min_lat, min_lng, max_lat, max_lng) of [lat, lng] pairs"""
+    lats, lngs = zip(*coordinates)
+    return min(lats), min(lngs), max(lats), max(lngs)
+
+
+# ==================== MVT Encoding ====================
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _len_field(field: int, payload: bytes) -> bytes:
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values: List[int]) -> bytes:
+    return _len_field(field, b"".join(_varint(v) for v in values))
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _encode_value(value) -> bytes:
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _key(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    return _len_field(1, str(value).encode("utf-8"))
+
+
+def _encode_geometry(points: List[Tuple[int, int]], is_point: bool) -> List[int]:
+    """Encode tile-space points as MVT MoveTo/LineTo command integers"""
+    commands = [(1 & 0x7) | (1 << 3)]
+    cx = cy = 0
+    for i, (px, py) in enumerate(points):
+        if i == 1 and not is_point:
+            commands.append((2 & 0x7) | ((len(points) - 1) << 3))
+        commands.append(_zigzag(px - cx))
+        commands.append(_zigzag(py - cy))
+        cx, cy = px, py
+    return commands
+
+
+class MVTLayer:
+    """Accumulates features, keys and values for a single MVT layer"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.features: List[bytes] = []
+        self.keys: List[str] = []
+        self.values: List = []
+        self._key_index = {}
+        self._value_index = {}
+
+    def _tags(self, properties: dict) -> List[int]:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if key not in self._key_index:
+                self._key_index[key] = len(self.keys)
+                self.keys.append(key)
+            value_key = (type(value).__name__, value)
+            if value_key not in self._value_index:
+                self._value_index[value_key] = len(self.values)
+                self.values.append(value)
+            tags.extend((self._key_index[key], self._value_index[value_key]))
+        return tags
+
+    def add_feature(self, points: List[Tuple[int, int]], properties: dict, is_point: bool):
+        geom_type = 1 if is_point else 2
+        feature = _packed(2, self._tags(properties))
+        feature += _key(3, 0) + _varint(geom_type)
+        feature += _packed(4, _encode_geometry(points, is_point))
+        self.features.append(feature)
+
+    def encode(self) -> bytes:
+        layer = _key(15, 0) + _varint(2)
+        layer += _len_field(1, self.name.encode("utf-8"))
+        for feature in self.features:
+            layer += _len_field(2, feature)
+        for key in self.keys:
+            layer += _len_field(3, key.encode("utf-8"))
+        for value in self.values:
+            layer += _len_field(4, _encode_value(value))
+        layer += _key(5, 0) + _varint(TILE_EXTENT)
+        return layer
+
+
+def _to_tile_points(coordinates: List[List[float]], z: int, x: int, y: int) -> List[Tuple[int, int]]:
+    """Project [lat, lng] pairs to integer tile-space coordinates, dropping repeats"""
+    points = []
+    for lat, lng in coordinates:
+        fx, fy = _mercator(lat, lng, z)
+        point = (round((fx - x) * TILE_EXTENT), round((fy - y) * TILE_EXTENT))
+        if not points or points[-1] != point:
+            points.append(point)
+    return points
+
+
+def encode_tile(z: int, x: int, y: int, roads: List[dict], pois: List[dict]) -> bytes:
+    """Encode road and POI documents into an MVT tile"""
+    road_layer = MVTLayer("roads")
+    for road in roads:
+        points = _to_tile_points(road['coordinates'], z, x, y)
+        if len(points) < 2:
+            continue
+        road_layer.add_feature(points, {
+            "id": road['id'],
+            "road_name": road.get('road_name'),
+            "road_type": road.get('road_type'),
+        }, is_point=False)
+
+    poi_layer = MVTLayer("pois")
+    for poi in pois:
+        poi_layer.add_feature(_to_tile_points([poi['location']], z, x, y), {
+            "id": poi['id'],
+            "name": poi.get('name'),
+            "category": poi.get('category'),
+            "poi_type": poi.get('poi_type'),
+        }, is_point=True)
+
+    tile = b""
+    for layer in (road_layer, poi_layer):
+        if layer.features:
+            tile += _len_field(3, layer.encode())
+    return tile
+
+
+async def render_tile(db, z: int, x: int, y: int) -> bytes:
+    """Query approved roads and POIs intersecting a tile and encode them"""
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(z, x, y)
+    pad_lat = (max_lat - min_lat) * TILE_BUFFER / TILE_EXTENT
+    pad_lng = (max_lng - min_lng) * TILE_BUFFER / TILE_EXTENT
+    bounds = (
+        max(min_lat - pad_lat, -90), max(min_lng - pad_lng, -180),
+        min(max_lat + pad_lat, 90), min(max_lng + pad_lng, 180)
+    )
+
+    level = simplification_level(z)
+    road_projection = {"_id": 0, "id": 1, "road_name": 1, "road_type": 1}
+    if level:
+        road_projection[f"simplified.{level}"] = 1
+    else:
+        road_projection["coordinates"] = 1
+
+    roads = await db.roads.find(
+        {**bbox_filter("$geoIntersects", *bounds), "status": "approved"},
+        road_projection
+    ).to_list(None)
+    if level:
+        for road in roads:
+            road['coordinates'] = road.pop('simplified', {}).get(level, [])
+
+    pois = await db.pois.find(
+        {**bbox_filter("$geoWithin", *bounds), "status": "approved"},
+        {"_id": 0, "id": 1, "name": 1, "category": 1, "poi_type": 1, "location": 1}
+    ).to_list(None)
+
+    return encode_tile(z, x, y, roads, pois)
+
+
+# ==================== Tile Cache ====================
+
+class TileCache:
+    """
+    On-disk tile cache shared by all workers, fronted by a per-process LRU
+    Memory entries remember the file's mtime so an invalidation done by
+    another worker (file deleted or rewritten) is noticed with one stat call.
+    Every invalidation also writes a new generation token; a tile rendered
+    under an older generation may predate the change and is not kept
+    """
+
+    def __init__(self, directory: Path, max_memory_tiles: int):
+        self.directory = Path(directory)
+        self.max_memory_tiles = max_memory_tiles
+        self._memory: "OrderedDict[Tuple[int, int, int], Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation_path = self.directory / "generation"
+
+    def _path(self, z: int, x: int, y: int) -> Path:
+        return self.directory / str(z) / str(x) / f"{y}.mvt"
+
+    def _read(self, key: Tuple[int, int, int]) -> Optional[bytes]:
+        path = self._path(*key)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and cached[0] == mtime:
+                self._memory.move_to_end(key)
+                return cached[1]
+
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            # Invalidated by another thread or worker since the stat
+            self._forget(key)
+            return None
+        self._remember(key, mtime, data)
+        return data
+
+    def _write(self, key: Tuple[int, int, int], data: bytes, generation: Optional[str]):
+        path = self._path(*key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        # Checked after the file is in place: an invalidation that ran before
+        # this point is seen here, and one that runs after deletes the file
+        if generation is not None and self._generation() != generation:
+            path.unlink(missing_ok=True)
+            return
+        try:
+            self._remember(key, path.stat().st_mtime, data)
+        except FileNotFoundError:
+            pass  # already invalidated again
+
+    def _generation(self) -> str:
+        try:
+            return self._generation_path.read_text()
+        except FileNotFoundError:
+            return ""
+
+    def _next_generation(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self._generation_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(uuid.uuid4().hex)
+        os.replace(tmp, self._generation_path)
+
+    def _forget(self, key: Tuple[int, int, int]):
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def _remember(self, key: Tuple[int, int, int], mtime: float, data: bytes):
+        with self._lock:
+            self._memory[key] = (mtime, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_tiles:
+                self._memory.popitem(last=False)
+
+    def _invalidate_bbox(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> int:
+        removed = 0
+        for z in range(TILE_MIN_ZOOM, TILE_MAX_ZOOM + 1):
+            zoom_dir = self.directory / str(z)
+            if not zoom_dir.is_dir():
+                continue
+            # Tiles are rendered with a TILE_BUFFER margin, so neighbours
+            # within that margin hold part of the geometry too
+            min_x, min_y, max_x, max_y = tile_range(
+                z, min_lat, min_lng, max_lat, max_lng, TILE_BUFFER / TILE_EXTENT
+            )
+            # Walk only what is actually cached instead of every tile in range
+            for x_entry in os.scandir(zoom_dir):
+                if not x_entry.name.isdigit() or not (min_x <= int(x_entry.name) <= max_x):
+                    continue
+                for y_entry in os.scandir(x_entry.path):
+                    y_name = y_entry.name[:-len(".mvt")]
+                    if y_entry.name.endswith(".mvt") and y_name.isdigit() and min_y <= int(y_name) <= max_y:
+                        self._forget((z, int(x_entry.name), int(y_name)))
+                        try:
+                            os.remove(y_entry.path)
+                        except FileNotFoundError:
+                            continue  # removed by another thread or worker
+                        removed += 1
+        return removed
+
+    async def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, (z, x, y))
+
+    async def generation(self) -> str:
+        """Token to read before rendering a tile and pass to put"""
+        return await asyncio.to_thread(self._generation)
+
+    async def put(self, z: int, x: int, y: int, data: bytes, generation: Optional[str] = None):
+        """Store a tile, unless the cache was invalidated since `generation` was read"""
+        await asyncio.to_thread(self._write, (z, x, y), data, generation)
+
+    def _invalidate_geometries(self, geometries) -> int:
+        self._next_generation()
+        return sum(self._invalidate_bbox(*coordinates_bbox(coordinates)) for coordinates in geometries if coordinates)
+
+    async def invalidate(self, *geometries: List[List[float]]):
+        """Drop every cached tile, at every zoom, touched by the given [lat, lng] point lists"""
+        if not any(geometries):
+            return
+        try:
+            removed = await asyncio.to_thread(self._invalidate_geometries, geometries)
+            if removed:
+                logger.info(f"Invalidated {removed} cached tiles")
+        except Exception as e:
+            logger.error(f"Error invalidating tile cache: {e}")
+
+
+tile_cache = TileCache(TILE_CACHE_DIR, TILE_MEMORY_CACHE_SIZE)
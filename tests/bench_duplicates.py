@@ -0,0 +1,73 @@
+"""
+Duplicate road check benchmark
+Measures the CPU side of the near-duplicate check on the submit path:
+resampling the new road to its `shape` and comparing it against the
+candidates returned by the index query, for candidates that are true
+duplicates (full comparison) and for nearby different roads (early exit)
+
+Usage: python tests/bench_duplicates.py [candidates]
+"""
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from config import DUPLICATE_ROAD_DISTANCE_METERS  # noqa: E402
+from geo import METERS_PER_DEGREE, hausdorff_distance, road_shape  # noqa: E402
+
+
+def trace(points: int, noise_m: float = 3.0, offset_m: float = 0.0, reverse: bool = False):
+    """A noisy GPS trace of the same ~1.5 km curved street"""
+    line = []
+    for i in range(points):
+        t = i / (points - 1)
+        lat = 34.5 + 0.01 * t + 0.002 * math.sin(t * 6) + (offset_m + random.gauss(0, noise_m)) / METERS_PER_DEGREE
+        lng = 69.2 + 0.01 * t + random.gauss(0, noise_m) / METERS_PER_DEGREE / 0.82
+        line.append([lat, lng])
+    return line[::-1] if reverse else line
+
+
+def measure(func, *args) -> float:
+    func(*args)
+    runs, elapsed = 0, 0.0
+    while elapsed < 0.5:
+        start = time.perf_counter()
+        func(*args)
+        elapsed += time.perf_counter() - start
+        runs += 1
+    return elapsed / runs * 1000
+
+
+def check(shape, candidates):
+    """Same loop as duplicates.find_duplicate_road; returns the closest distance"""
+    limit = DUPLICATE_ROAD_DISTANCE_METERS
+    best = None
+    for other in candidates:
+        distance = hausdorff_distance(shape, other, limit)
+        if distance <= limit:
+            best = limit = distance
+    return best
+
+
+def main(count: int):
+    random.seed(7)
+    road = trace(1000)
+    shape = road_shape(road)
+    duplicates = [road_shape(trace(random.randint(100, 1000), reverse=i % 2 == 1)) for i in range(count)]
+    parallel = [road_shape(trace(random.randint(100, 1000), offset_m=40)) for _ in range(count)]
+
+    closest = check(shape, duplicates)
+    flagged = "flagged" if closest is not None else "missed"
+    cleared = "cleared" if check(shape, parallel) is None else "false positive"
+
+    print(f"threshold {DUPLICATE_ROAD_DISTANCE_METERS} m, {count} candidates, {len(shape)}-point shapes")
+    print(f"{'resample 1000-point road':<42}{measure(road_shape, road):>8.3f} ms")
+    print(f"{'compare vs duplicates':<42}{measure(check, shape, duplicates):>8.3f} ms  ({flagged}, closest {closest:.1f} m)")
+    print(f"{'compare vs parallel street 40 m away':<42}{measure(check, shape, parallel):>8.3f} ms  ({cleared})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,391 @@
+"""
+Endpoint load test
+Boots the FastAPI app in-process against an in-memory MongoDB stand-in
+(tests/memory_db.py) or a real mongod, seeds realistic volumes (users,
+1000-point roads, POIs, notifications), drives concurrent requests at each
+route through the full middleware stack and writes throughput and
+p50/p95/p99 latency per route to a JSON report
+
+The stand-in scans instead of using indexes, so its numbers measure the
+app's own work (validation, serialization, middleware) plus a scan; use
+--mongo-url for end-to-end numbers. With --mongo-url the data goes into
+the `maser_loadtest` database whatever DB_NAME says, dropped before and
+after the run
+
+Usage: python tests/bench_endpoints.py [--mongo-url URL] [--requests N]
+           [--concurrency C] [--routes SUBSTRING ...] [--output FILE]
+           [--compare BASELINE_FILE]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from urllib.parse import urlencode
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR.parent / 'backend'))
+sys.path.insert(0, str(TESTS_DIR))
+
+# Center of the seeded area (Tehran) and its half-size in degrees
+CENTER = (35.70, 51.40)
+SPREAD = 0.05
+ROAD_TYPES = ['خیابان اصلی', 'خیابان فرعی', 'کوچه', 'بزرگراه']
+TILE_ZOOM = 14
+# The only database a run against a real mongod will use (and drop)
+LOADTEST_DB_NAME = 'maser_loadtest'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--mongo-url', help="run against this mongod instead of the in-memory stand-in")
+    parser.add_argument('--requests', type=int, default=500, help="measured requests per route")
+    parser.add_argument('--concurrency', type=int, default=10, help="requests in flight per route")
+    parser.add_argument('--routes', nargs='*', help="only run routes whose name contains one of these")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--roads', type=int, default=500)
+    parser.add_argument('--points', type=int, default=1000, help="points per road")
+    parser.add_argument('--pois', type=int, default=2000)
+    parser.add_argument('--notifications', type=int, default=50, help="notifications per user")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="report path (default tests/results/endpoints-<commit>.json)")
+    parser.add_argument('--compare', help="earlier report to print changes against")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Settings that must be in place before the app modules are imported"""
+    os.environ['RATE_LIMIT_PER_MINUTE'] = os.environ['RATE_LIMIT_PER_HOUR'] = str(10 ** 9)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['TILE_CACHE_DIR'] = tempfile.mkdtemp(prefix='maser-bench-tiles-')
+    if args.mongo_url:
+        os.environ['MONGO_URL'] = args.mongo_url
+        os.environ['DB_NAME'] = LOADTEST_DB_NAME
+
+
+# ==================== Data ====================
+
+def random_point(rng):
+    return [CENTER[0] + rng.uniform(-SPREAD, SPREAD), CENTER[1] + rng.uniform(-SPREAD, SPREAD)]
+
+
+def random_road(rng, points: int):
+    """A wandering GPS trace with ~5 m between points"""
+    lat, lng = random_point(rng)
+    heading = rng.uniform(0, 2 * math.pi)
+    line = []
+    for _ in range(points):
+        line.append([round(lat, 6), round(lng, 6)])
+        heading += rng.gauss(0, 0.05)
+        lat += 4.5e-5 * math.sin(heading)
+        lng += 5.5e-5 * math.cos(heading)
+    return line
+
+
+async def seed(db, args, rng):
+    """Insert users, roads, POIs, notifications and personal locations; returns the user ids"""
+    from geo import encode_polyline, line_bounds, road_shape, simplify_levels, to_geojson_linestring, to_geojson_point
+    from models import POI, PersonalLocation, RoadSubmission, User
+    from notifications import build_notification
+
+    now = datetime.now(timezone.utc)
+    users = [User(
+        email=f"bench{i}@example.com", full_name=f"کاربر {i}", coins=rng.randint(0, 50),
+        created_at=now - timedelta(days=rng.uniform(0, 365))
+    ).model_dump() for i in range(args.users)]
+    for user in users:
+        user['password'] = "not-a-real-hash"
+    await db.users.insert_many(users)
+    user_ids = [user['id'] for user in users]
+
+    roads = []
+    for i in range(args.roads):
+        status = rng.choices(["approved", "pending", "rejected"], [6, 3, 1])[0]
+        road = RoadSubmission(
+            user_id=rng.choice(user_ids), road_name=f"خیابان {i}", road_type=rng.choice(ROAD_TYPES),
+            coordinates=random_road(rng, args.points), status=status, coin_awarded=status == "approved",
+            created_at=now - timedelta(minutes=rng.uniform(0, 60 * 24 * 90))
+        ).model_dump()
+        road['geo'] = to_geojson_linestring(road['coordinates'])
+        road['polyline'] = encode_polyline(road['coordinates'])
+        road['shape'] = road_shape(road['coordinates'])
+        road['shape_bounds'] = line_bounds(road['shape'])
+        if status == "approved":
+            road['simplified'] = simplify_levels(road['coordinates'])
+        roads.append(road)
+    for start in range(0, len(roads), 100):
+        await db.roads.insert_many(roads[start:start + 100])
+
+    pois = []
+    for i in range(args.pois):
+        poi = POI(
+            user_id=rng.choice(user_ids), name=f"مکان {i}", category=rng.choice(['عمومی', 'خصوصی']),
+            poi_type=rng.choice(['رستوران', 'پارک', 'بیمارستان', 'مدرسه']), location=random_point(rng),
+            status=rng.choices(["approved", "pending", "rejected"], [6, 3, 1])[0],
+            created_at=now - timedelta(minutes=rng.uniform(0, 60 * 24 * 90))
+        ).model_dump()
+        poi['geo'] = to_geojson_point(poi['location'])
+        pois.append(poi)
+    await db.pois.insert_many(pois)
+
+    notifications, locations = [], []
+    for user_id in user_ids:
+        for i in range(args.notifications):
+            notification = build_notification(user_id, "سکه دریافت شد!", f"مسیر {i} شما تایید شد.")
+            notification['created_at'] = now - timedelta(minutes=rng.uniform(0, 60 * 24 * 30))
+            notification['read'] = rng.random() < 0.7
+            notifications.append(notification)
+        for name in ("خانه", "محل کار"):
+            locations.append(PersonalLocation(user_id=user_id, name=name, location=random_point(rng)).model_dump())
+    await db.notifications.insert_many(notifications)
+    await db.personal_locations.insert_many(locations)
+    return user_ids
+
+
+# ==================== Scenarios ====================
+
+def tile_for(lat: float, lng: float, z: int):
+    n = 2 ** z
+    x = int((lng + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return x, y
+
+
+def build_scenarios(rng, tokens, roads_etag: str):
+    """name -> function returning (method, path, query, headers, body) for one request"""
+    def auth():
+        return {"authorization": f"Bearer {rng.choice(tokens)}"}
+
+    def viewport():
+        lat, lng = random_point(rng)
+        return {"min_lat": lat, "min_lng": lng, "max_lat": lat + 0.02, "max_lng": lng + 0.02, "zoom": 14}
+
+    def tile():
+        x, y = tile_for(*random_point(rng), TILE_ZOOM)
+        return "GET", f"/api/tiles/{TILE_ZOOM}/{x}/{y}.mvt", {}, {}, None
+
+    def new_road():
+        body = {"road_name": "خیابان تازه", "road_type": rng.choice(ROAD_TYPES), "coordinates": random_road(rng, 1000)}
+        return "POST", "/api/roads", {}, auth(), body
+
+    def new_poi():
+        body = {"name": "مکان تازه", "category": "عمومی", "poi_type": "پارک", "location": random_point(rng)}
+        return "POST", "/api/pois", {}, auth(), body
+
+    return {
+        "GET /health": lambda: ("GET", "/api/health", {}, {}, None),
+        "GET /auth/me": lambda: ("GET", "/api/auth/me", {}, auth(), None),
+        "GET /roads": lambda: ("GET", "/api/roads", {"status": "approved", "page_size": 20}, {}, None),
+        "GET /roads?format=polyline": lambda: (
+            "GET", "/api/roads", {"status": "approved", "page_size": 20, "format": "polyline"}, {}, None),
+        "GET /roads (If-None-Match)": lambda: (
+            "GET", "/api/roads", {"status": "approved", "page_size": 20}, {"if-none-match": roads_etag}, None),
+        "GET /roads/bbox": lambda: ("GET", "/api/roads/bbox", viewport(), {}, None),
+        "GET /roads/user": lambda: ("GET", "/api/roads/user", {}, auth(), None),
+        "GET /pois": lambda: ("GET", "/api/pois", {"status": "approved", "page_size": 20}, {}, None),
+        "GET /pois/nearby": lambda: (
+            "GET", "/api/pois/nearby", dict(zip(("lat", "lng"), random_point(rng)), radius=1000), {}, None),
+        "GET /tiles": tile,
+        "GET /notifications": lambda: ("GET", "/api/notifications", {"limit": 50}, auth(), None),
+        "GET /notifications/unread-count": lambda: ("GET", "/api/notifications/unread-count", {}, auth(), None),
+        "GET /locations/personal": lambda: ("GET", "/api/locations/personal", {}, auth(), None),
+        "POST /roads": new_road,
+        "POST /pois": new_poi,
+    }
+
+
+# ==================== Driver ====================
+
+async def call(app, method: str, path: str, query: dict, headers: dict, body):
+    """One request through the ASGI app, like a server would; returns (status, headers, body)"""
+    payload = json.dumps(body).encode() if body is not None else b""
+    raw_headers = [(b"host", b"bench"), (b"accept-encoding", b"gzip")]
+    raw_headers += [(name.encode(), value.encode()) for name, value in headers.items()]
+    if body is not None:
+        raw_headers.append((b"content-type", b"application/json"))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": urlencode(query).encode(), "root_path": "", "headers": raw_headers,
+        "client": ("127.0.0.1", 5000), "server": ("bench", 80),
+    }
+    done = asyncio.Event()
+    body_sent = False
+    response = {"status": 0, "headers": {}, "body": b""}
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {name.decode(): value.decode() for name, value in message["headers"]}
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return response["status"], response["headers"], response["body"]
+
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))]
+
+
+async def run_route(app, build, requests: int, concurrency: int) -> dict:
+    for _ in range(min(20, requests)):
+        await call(app, *build())
+
+    latencies, statuses = [], Counter()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            request = build()
+            start = time.perf_counter()
+            status, _, _ = await call(app, *request)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+        "status": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+# ==================== Report ====================
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=TESTS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(routes: dict):
+    print(f"{'route':<34}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, result in routes.items():
+        print(f"{name:<34}{result['throughput_rps']:>9.1f}{result['p50_ms']:>9.2f}"
+              f"{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['errors']:>8}")
+
+
+def print_comparison(routes: dict, baseline_path: str):
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nchange vs {baseline_path} (commit {baseline['meta'].get('commit')}, negative latency is faster)")
+    print(f"{'route':<34}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    for name, result in routes.items():
+        old = baseline['routes'].get(name)
+        if old is None:
+            print(f"{name:<34}{'(new)':>9}")
+            continue
+        print(f"{name:<34}{change(result['throughput_rps'], old['throughput_rps']):>9}"
+              + "".join(f"{change(result[key], old[key]):>9}" for key in ("p50_ms", "p95_ms", "p99_ms")))
+
+
+# ==================== Main ====================
+
+async def main(args):
+    import database
+    import server
+    from taskqueue import drain_queues
+
+    if args.mongo_url:
+        db = database.db
+        if db.name != LOADTEST_DB_NAME:
+            raise SystemExit(f"refusing to drop database {db.name!r}; the load test only uses {LOADTEST_DB_NAME!r}")
+        await database.client.drop_database(db.name)
+        await database.init_database()
+    else:
+        from memory_db import MemoryDatabase
+        motor_db, db = database.db, MemoryDatabase()
+        # Every module that imported the Motor database gets the stand-in
+        for module in list(sys.modules.values()):
+            if getattr(module, 'db', None) is motor_db:
+                module.db = db
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    user_ids = await seed(db, args, rng)
+    print(f"seeded {args.users} users, {args.roads} roads x {args.points} points, {args.pois} POIs, "
+          f"{args.users * args.notifications} notifications in {time.perf_counter() - started:.1f}s "
+          f"({'mongodb' if args.mongo_url else 'in-memory stand-in'})")
+
+    tokens = [server.create_access_token(user_id) for user_id in user_ids]
+    _, headers, _ = await call(server.app, "GET", "/api/roads", {"status": "approved", "page_size": 20}, {}, None)
+    scenarios = build_scenarios(rng, tokens, headers.get("etag", ""))
+    if args.routes:
+        scenarios = {name: build for name, build in scenarios.items() if any(part in name for part in args.routes)}
+
+    routes = {}
+    try:
+        for name, build in scenarios.items():
+            routes[name] = await run_route(server.app, build, args.requests, args.concurrency)
+            print(f"  {name}: {routes[name]['throughput_rps']} req/s", file=sys.stderr)
+        await drain_queues()
+    finally:
+        if args.mongo_url:
+            await database.client.drop_database(db.name)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "backend": "mongodb" if args.mongo_url else "memory",
+            "python": sys.version.split()[0],
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": {
+                "users": args.users, "roads": args.roads, "points_per_road": args.points,
+                "pois": args.pois, "notifications_per_user": args.notifications,
+            },
+        },
+        "routes": routes,
+    }
+    output = Path(args.output) if args.output else TESTS_DIR / "results" / f"endpoints-{commit or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+    print_results(routes)
+    print(f"\nreport written to {output}")
+    if args.compare:
+        print_comparison(routes, args.compare)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    configure_environment(arguments)
+    asyncio.run(main(arguments))
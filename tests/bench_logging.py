@@ -0,0 +1,78 @@
+"""
+Logging overhead benchmark
+Measures how long a log call holds the calling thread (the event loop in
+the API) with the previous synchronous StreamHandler versus the queue
+handler from backend/logging_config.py, writing to a fast sink and to a
+slow one that stands in for a blocked pipe or a busy log collector
+
+Usage: python tests/bench_logging.py [records]
+"""
+import io
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueListener
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from logging_config import TEXT_FORMAT, JsonFormatter, _QueueHandler  # noqa: E402
+
+
+class SlowStream(io.StringIO):
+    """A sink whose writes take `delay` seconds"""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+        return len(text)
+
+
+def measure(logger: logging.Logger, records: int) -> float:
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info("GET %s %s %.1fms", "/api/roads", 200, 12.5, extra={"status": 200, "duration_ms": 12.5})
+    return (time.perf_counter() - start) / records * 1e6
+
+
+def run(sink, formatter, use_queue: bool, records: int) -> float:
+    logger = logging.getLogger(f"bench.{id(sink)}.{use_queue}")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    output = logging.StreamHandler(sink)
+    output.setFormatter(formatter)
+    listener = None
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        logger.addHandler(_QueueHandler(log_queue))
+        listener = QueueListener(log_queue, output)
+        listener.start()
+    else:
+        logger.addHandler(output)
+    try:
+        return measure(logger, records)
+    finally:
+        if listener:
+            listener.stop()
+
+
+def main(records: int):
+    cases = [
+        ("text, fast sink", lambda: io.StringIO(), logging.Formatter(TEXT_FORMAT)),
+        ("json, fast sink", lambda: io.StringIO(), JsonFormatter()),
+        ("text, 1 ms sink", lambda: SlowStream(0.001), logging.Formatter(TEXT_FORMAT)),
+    ]
+    print(f"{'sink':<22}{'sync handler':>14}{'queue handler':>15}   us per log call on the caller")
+    for name, sink, formatter in cases:
+        count = records if "fast" in name else records // 20
+        before = run(sink(), formatter, False, count)
+        after = run(sink(), formatter, True, count)
+        print(f"{name:<22}{before:>14.1f}{after:>15.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,129 @@
+"""
+Middleware overhead benchmark
+Compares the per-request cost of the previous BaseHTTPMiddleware stack with
+the pure ASGI middleware in backend/middleware.py (with and without the
+metrics middleware), calling the ASGI app
+in-process so only middleware and routing overhead is measured
+
+Usage: python tests/bench_middleware.py [requests]
+"""
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from fastapi import FastAPI, Request
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+
+from config import SECURITY_HEADERS
+import middleware
+from ratelimit import MemoryRateLimitBackend
+
+logging.disable(logging.CRITICAL)
+
+
+# ==================== Previous Implementation ====================
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        result = await middleware.rate_limit_backend.hit(request.client.host, middleware.RATE_LIMITS)
+        response = await call_next(request)
+        response.headers['X-RateLimit-Remaining-Minute'] = str(result.remaining[0])
+        return response
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+        for header, value in SECURITY_HEADERS.items():
+            response.headers[header] = value
+        return response
+
+
+class LegacyRequestLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        response.headers['X-Process-Time'] = f"{time.time() - start_time:.4f}"
+        return response
+
+
+# ==================== Benchmark ====================
+
+def build_app(*middleware_classes) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(GZipMiddleware, minimum_size=1000)
+    for cls in middleware_classes:
+        app.add_middleware(cls)
+    return app
+
+
+async def call(app, scope):
+    # Behave like a server: one request body, then disconnect once the response is done
+    done = asyncio.Event()
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            done.set()
+
+    await app(dict(scope), receive, send)
+
+
+async def measure(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/api/ping", "raw_path": b"/api/ping",
+        "query_string": b"", "root_path": "", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 5000), "server": ("bench", 80),
+    }
+    for _ in range(200):
+        await call(app, scope)
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, scope)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def main(requests: int):
+    # Lift the limits so every request takes the full path
+    middleware.RATE_LIMITS = [(60, 10 ** 9), (3600, 10 ** 9)]
+    middleware.rate_limit_backend = MemoryRateLimitBackend()
+
+    variants = {
+        "no middleware": build_app(),
+        "BaseHTTPMiddleware (before)": build_app(
+            LegacySecurityHeadersMiddleware, LegacyRequestLoggingMiddleware, LegacyRateLimitMiddleware),
+        "pure ASGI (after)": build_app(
+            middleware.SecurityHeadersMiddleware, middleware.RequestLoggingMiddleware, middleware.RateLimitMiddleware),
+        "pure ASGI + metrics": build_app(
+            middleware.SecurityHeadersMiddleware, middleware.RequestLoggingMiddleware,
+            middleware.MetricsMiddleware, middleware.RateLimitMiddleware),
+    }
+    results = {name: await measure(app, requests) for name, app in variants.items()}
+
+    baseline = results["no middleware"]
+    print(f"{'variant':<30}{'us/request':>12}{'overhead us':>14}")
+    for name, value in results.items():
+        print(f"{name:<30}{value:>12.1f}{value - baseline:>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,106 @@
+"""
+Response serialization benchmark
+Compares, per endpoint, the time FastAPI spends turning a list of stored
+documents into a response body through response_model (Pydantic validation
+with every field validator, jsonable_encoder, stdlib json) against the
+DocumentResponse fast path (orjson, or stdlib json when orjson is missing)
+
+Usage: python tests/bench_serialization.py [points_per_road]
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import responses  # noqa: E402
+from models import Notification, PersonalLocation, RoadSubmission  # noqa: E402
+
+
+def make_roads(count: int, points: int):
+    start = datetime.utcnow().replace(microsecond=0)
+    return [{
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "road_name": "خیابان تست",
+        "road_type": "خیابان اصلی",
+        "coordinates": [[35.7 + j * 1e-5, 51.4 + j * 1e-5] for j in range(points)],
+        "status": "approved",
+        "coin_awarded": True,
+        "created_at": start - timedelta(seconds=i),
+    } for i in range(count)]
+
+
+def make_notifications(count: int):
+    start = datetime.utcnow().replace(microsecond=0)
+    return [{
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "title": "سکه دریافت شد!",
+        "message": "تبریک! مسیر 'خیابان تست' شما تایید شد و 1 سکه مسیر به شما اضافه شد.",
+        "read": False,
+        "created_at": start - timedelta(seconds=i),
+    } for i in range(count)]
+
+
+def make_locations(count: int):
+    start = datetime.utcnow().replace(microsecond=0)
+    return [{
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "name": "خانه",
+        "location": [35.7, 51.4],
+        "created_at": start - timedelta(seconds=i),
+    } for i in range(count)]
+
+
+def response_model_path(field, docs) -> bytes:
+    content = asyncio.run(serialize_response(field=field, response_content=docs, is_coroutine=True))
+    return JSONResponse(content).body
+
+
+def fast_path(docs) -> bytes:
+    return responses.DocumentResponse(docs).body
+
+
+def measure(func, *args) -> float:
+    func(*args)
+    runs, elapsed = 0, 0.0
+    while elapsed < 1.0 or runs < 3:
+        start = time.perf_counter()
+        func(*args)
+        elapsed += time.perf_counter() - start
+        runs += 1
+    return elapsed / runs * 1000
+
+
+def main(points: int):
+    cases = [
+        (f"GET /roads/user (1000 roads x {points} pts)", RoadSubmission, make_roads(1000, points)),
+        ("GET /notifications (100)", Notification, make_notifications(100)),
+        ("GET /locations/personal (100)", PersonalLocation, make_locations(100)),
+    ]
+    orjson = responses.orjson
+
+    print(f"{'endpoint':<42}{'response_model':>15}{'orjson':>10}{'stdlib':>10}   ms/response")
+    for name, model, docs in cases:
+        field = create_response_field(name="response", type_=list[model])
+        before = measure(response_model_path, field, docs)
+
+        fast = measure(fast_path, docs) if orjson else float("nan")
+        responses.orjson = None
+        stdlib = measure(fast_path, docs)
+        responses.orjson = orjson
+
+        print(f"{name:<42}{before:>15.2f}{fast:>10.2f}{stdlib:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,71 @@
+"""
+Timestamp storage benchmark
+Measures the CPU cost of one page of 100 road documents when created_at is
+stored as an ISO-8601 string (BSON decode + the per-row fromisoformat loop the
+read endpoints used to run) versus a native BSON date (BSON decode only).
+Pages are decoded with decode_all, as the driver does for a reply batch
+
+Usage: python tests/bench_timestamps.py [iterations]
+"""
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import bson
+
+PAGE_SIZE = 100
+
+
+def make_page(as_string: bool):
+    start = datetime.now(timezone.utc)
+    docs = []
+    for i in range(PAGE_SIZE):
+        created_at = (start - timedelta(seconds=i)).replace(microsecond=0)
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "user_id": str(uuid.uuid4()),
+            "road_name": "خیابان تست",
+            "road_type": "خیابان اصلی",
+            "status": "approved",
+            "coin_awarded": True,
+            "created_at": created_at.isoformat() if as_string else created_at,
+        })
+    return b"".join(bson.encode(doc) for doc in docs)
+
+
+def read_strings(raw_page):
+    docs = bson.decode_all(raw_page)
+    for doc in docs:
+        if isinstance(doc['created_at'], str):
+            doc['created_at'] = datetime.fromisoformat(doc['created_at'])
+    return docs
+
+
+def read_dates(raw_page):
+    return bson.decode_all(raw_page)
+
+
+def measure(func, raw_page, iterations: int) -> float:
+    for _ in range(100):
+        func(raw_page)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(raw_page)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations: int):
+    string_page, date_page = make_page(True), make_page(False)
+    before = measure(read_strings, string_page, iterations)
+    after = measure(read_dates, date_page, iterations)
+
+    print(f"page of {PAGE_SIZE} roads, {iterations} iterations")
+    print(f"{'ISO string + fromisoformat (before)':<40}{before:>10.1f} us/page")
+    print(f"{'native BSON date (after)':<40}{after:>10.1f} us/page")
+    print(f"{'saved':<40}{before - after:>10.1f} us/page")
+    print(f"{'stored bytes per page':<40}{len(string_page):>6} -> {len(date_page)}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
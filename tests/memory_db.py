@@ -0,0 +1,421 @@
+"""
+In-memory MongoDB stand-in for the endpoint benchmark
+Implements the subset of Motor's async API the MASER routes use (find /
+aggregate cursors, inserts, updates, upserts, bulk writes, counts) over
+plain lists, so the app can be benchmarked without a mongod
+
+Limitations: indexes are not used (every query is a scan), unique indexes
+are not enforced, and geo queries treat the query polygon as its bounding
+box with planar lng/lat math - fine for the bbox polygons the app builds.
+Returned documents are new dicts but share their lists with the stored
+ones (copying 1000-point lines would dominate the timings), so they must
+not be modified in place
+"""
+import math
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo.results import BulkWriteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+EARTH_RADIUS_METERS = 6378100
+
+_MISSING = object()
+
+
+# ==================== Documents ====================
+
+def _bson(value):
+    """Mimic a BSON round trip: dates come back naive UTC with millisecond precision"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    if isinstance(value, dict):
+        return {key: _bson(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_bson(item) for item in value]
+    return value
+
+
+def _get(doc, path: str):
+    for part in path.split('.'):
+        if isinstance(doc, dict) and part in doc:
+            doc = doc[part]
+        else:
+            return _MISSING
+    return doc
+
+
+def _set(doc, path: str, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _project(doc: dict, projection) -> dict:
+    if not projection:
+        return dict(doc)
+    include = {key for key, value in projection.items() if value and key != '_id'}
+    if include:
+        result = {}
+        if projection.get('_id', 1) and '_id' in doc:
+            result['_id'] = doc['_id']
+        for path in include:
+            value = _get(doc, path)
+            if value is not _MISSING:
+                _set(result, path, value)
+        return result
+    result = dict(doc)
+    for path in projection:
+        parts = path.split('.')
+        target = result
+        for part in parts[:-1]:
+            if not isinstance(target.get(part), dict):
+                break
+            target[part] = target = dict(target[part])
+        else:
+            target.pop(parts[-1], None)
+    return result
+
+
+# ==================== Query matching ====================
+
+def _bounds(geometry: dict):
+    ring = geometry['coordinates'][0]
+    lngs = [point[0] for point in ring]
+    lats = [point[1] for point in ring]
+    return min(lngs), min(lats), max(lngs), max(lats)
+
+
+def _points(geometry: dict):
+    if geometry['type'] == 'Point':
+        return [geometry['coordinates']]
+    return geometry['coordinates']
+
+
+def _inside(point, box) -> bool:
+    return box[0] <= point[0] <= box[2] and box[1] <= point[1] <= box[3]
+
+
+def _segment_hits_box(a, b, box) -> bool:
+    """Liang-Barsky clipping of segment a-b against box"""
+    t0, t1 = 0.0, 1.0
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    for p, q in ((-dx, a[0] - box[0]), (dx, box[2] - a[0]), (-dy, a[1] - box[1]), (dy, box[3] - a[1])):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+# id(geometry) -> (geometry, its bounds); stored geometries are never modified
+_geometry_bounds = {}
+
+
+def _extent(geometry):
+    cached = _geometry_bounds.get(id(geometry))
+    if cached is None or cached[0] is not geometry:
+        points = _points(geometry)
+        lngs = [point[0] for point in points]
+        lats = [point[1] for point in points]
+        cached = _geometry_bounds[id(geometry)] = (geometry, (min(lngs), min(lats), max(lngs), max(lats)))
+    return cached[1]
+
+
+def _geo_within(geometry, box) -> bool:
+    extent = _extent(geometry)
+    return box[0] <= extent[0] and box[1] <= extent[1] and extent[2] <= box[2] and extent[3] <= box[3]
+
+
+def _geo_intersects(geometry, box) -> bool:
+    extent = _extent(geometry)
+    if extent[2] < box[0] or extent[0] > box[2] or extent[3] < box[1] or extent[1] > box[3]:
+        return False
+    points = _points(geometry)
+    if any(_inside(point, box) for point in points):
+        return True
+    return any(_segment_hits_box(a, b, box) for a, b in zip(points, points[1:]))
+
+
+def _compare(value, operand, op) -> bool:
+    if value is _MISSING or value is None:
+        return False
+    try:
+        return op(value, _bson(operand))
+    except TypeError:
+        return False
+
+
+def _match_operator(value, op: str, operand) -> bool:
+    if op == '$in':
+        return value in operand if value is not _MISSING else None in operand
+    if op == '$ne':
+        return value != operand if value is not _MISSING else operand is not None
+    if op == '$exists':
+        return (value is not _MISSING) == bool(operand)
+    if op == '$lt':
+        return _compare(value, operand, lambda a, b: a < b)
+    if op == '$lte':
+        return _compare(value, operand, lambda a, b: a <= b)
+    if op == '$gt':
+        return _compare(value, operand, lambda a, b: a > b)
+    if op == '$gte':
+        return _compare(value, operand, lambda a, b: a >= b)
+    if op == '$geoWithin':
+        return isinstance(value, dict) and _geo_within(value, _bounds(operand['$geometry']))
+    if op == '$geoIntersects':
+        return isinstance(value, dict) and _geo_intersects(value, _bounds(operand['$geometry']))
+    raise NotImplementedError(f"memory_db does not support {op}")
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(condition, dict) and condition and all(op.startswith('$') for op in condition):
+            if not all(_match_operator(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif value is _MISSING:
+            if condition is not None:
+                return False
+        elif value != condition and not (isinstance(value, list) and condition in value):
+            return False
+    return True
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        if op == '$set' or (op == '$setOnInsert' and inserting):
+            for path, value in fields.items():
+                _set(doc, path, _bson(value))
+        elif op == '$unset':
+            for path in fields:
+                parts = path.split('.')
+                parent = _get(doc, '.'.join(parts[:-1])) if len(parts) > 1 else doc
+                if isinstance(parent, dict):
+                    parent.pop(parts[-1], None)
+        elif op == '$inc':
+            for path, amount in fields.items():
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + amount)
+        elif op != '$setOnInsert':
+            raise NotImplementedError(f"memory_db does not support update operator {op}")
+
+
+def _sort_key(value):
+    # Missing/None sort first, as in MongoDB
+    return (0, 0) if value is _MISSING or value is None else (1, value)
+
+
+def _sorted(docs, sort):
+    for key, direction in reversed(sort):
+        docs = sorted(docs, key=lambda doc: _sort_key(_get(doc, key)), reverse=direction < 0)
+    return docs
+
+
+def _haversine(a, b) -> float:
+    lng1, lat1, lng2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(h))
+
+
+# ==================== Cursors ====================
+
+class MemoryCursor:
+    def __init__(self, load, projection=None):
+        self._load = load
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key, direction=None):
+        self._sort = list(key) if isinstance(key, list) else [(key, direction or 1)]
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _run(self):
+        if self._results is None:
+            docs = _sorted(self._load(), self._sort) if self._sort else self._load()
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = iter([_project(doc, self._projection) for doc in docs])
+        return self._results
+
+    async def to_list(self, length=None):
+        results = self._run()
+        if length is None:
+            return list(results)
+        return [doc for _, doc in zip(range(length), results)]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._run())
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        self._results = iter(())
+
+
+# ==================== Collections ====================
+
+class MemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.docs = []
+
+    def _matching(self, query):
+        return [doc for doc in self.docs if matches(doc, query or {})]
+
+    def find(self, query=None, projection=None, **kwargs):
+        return MemoryCursor(lambda: self._matching(query), projection)
+
+    async def find_one(self, query=None, projection=None):
+        for doc in self.docs:
+            if matches(doc, query or {}):
+                return _project(doc, projection)
+        return None
+
+    async def find_one_and_update(self, query, update, projection=None, **kwargs):
+        for doc in self.docs:
+            if matches(doc, query):
+                before = _project(doc, projection)
+                _apply_update(doc, update, inserting=False)
+                return before
+        return None
+
+    async def insert_one(self, doc: dict):
+        doc.setdefault('_id', ObjectId())
+        self.docs.append(_bson(doc))
+        return InsertOneResult(doc['_id'], True)
+
+    async def insert_many(self, docs, ordered: bool = True):
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+            self.docs.append(_bson(doc))
+        return InsertManyResult([doc['_id'] for doc in docs], True)
+
+    def _update(self, query, update, upsert: bool, many: bool):
+        matched = 0
+        for doc in self.docs:
+            if matches(doc, query):
+                _apply_update(doc, update, inserting=False)
+                matched += 1
+                if not many:
+                    break
+        upserted_id = None
+        if not matched and upsert:
+            doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            doc.setdefault('_id', ObjectId())
+            _apply_update(doc, update, inserting=True)
+            self.docs.append(doc)
+            upserted_id = doc['_id']
+        return matched, upserted_id
+
+    async def update_one(self, query, update, upsert: bool = False):
+        matched, upserted_id = self._update(query, update, upsert, many=False)
+        return UpdateResult({"n": matched or int(upserted_id is not None), "nModified": matched,
+                             "upserted": upserted_id}, True)
+
+    async def update_many(self, query, update, upsert: bool = False):
+        matched, upserted_id = self._update(query, update, upsert, many=True)
+        return UpdateResult({"n": matched, "nModified": matched, "upserted": upserted_id}, True)
+
+    async def bulk_write(self, requests, ordered: bool = True):
+        matched = upserted = 0
+        for request in requests:
+            count, upserted_id = self._update(request._filter, request._doc, request._upsert, many=False)
+            matched += count
+            upserted += upserted_id is not None
+        return BulkWriteResult({"nMatched": matched, "nModified": matched, "nUpserted": upserted}, True)
+
+    async def count_documents(self, query, limit: int = 0, **kwargs):
+        count = len(self._matching(query))
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    def aggregate(self, pipeline):
+        def load():
+            docs = self.docs
+            for stage in pipeline:
+                (op, spec), = stage.items()
+                if op == '$geoNear':
+                    near = spec['near']['coordinates']
+                    found = []
+                    for doc in docs:
+                        geo = doc.get('geo')
+                        if not geo or not matches(doc, spec.get('query', {})):
+                            continue
+                        distance = _haversine(near, geo['coordinates'])
+                        if distance <= spec.get('maxDistance', math.inf):
+                            found.append({**doc, spec['distanceField']: distance})
+                    docs = sorted(found, key=lambda doc: doc[spec['distanceField']])
+                elif op == '$match':
+                    docs = [doc for doc in docs if matches(doc, spec)]
+                elif op == '$limit':
+                    docs = docs[:spec]
+                elif op == '$project':
+                    docs = [_project(doc, spec) for doc in docs]
+                else:
+                    raise NotImplementedError(f"memory_db does not support {op}")
+            return docs
+        return MemoryCursor(load)
+
+    async def create_index(self, *args, **kwargs):
+        return None
+
+    async def index_information(self):
+        return {}
+
+
+class MemoryDatabase:
+    """Stands in for a Motor database; collections are created on first use"""
+
+    def __init__(self, name: str = "memory"):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    async def command(self, name, *args, **kwargs):
+        if name == 'ping':
+            return {"ok": 1.0}
+        raise NotImplementedError(f"memory_db does not support the {name} command")
@@ -0,0 +1,105 @@
+"""
+Near-duplicate road check against the in-memory database stand-in
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+
+import database  # noqa: E402
+import duplicates  # noqa: E402
+import submissions  # noqa: E402
+from config import DUPLICATE_ROAD_CANDIDATE_LIMIT  # noqa: E402
+from geo import METERS_PER_DEGREE, line_bounds, road_shape, to_geojson_linestring  # noqa: E402
+from memory_db import MemoryDatabase  # noqa: E402
+
+START, END = (34.5, 69.2), (34.509, 69.209)
+
+
+def street(offset_m: float = 0.0, points: int = 50):
+    """A straight ~1.3 km street, shifted north by offset_m"""
+    shift = offset_m / METERS_PER_DEGREE
+    return [
+        [START[0] + (END[0] - START[0]) * i / (points - 1) + shift,
+         START[1] + (END[1] - START[1]) * i / (points - 1)]
+        for i in range(points)
+    ]
+
+
+def road_doc(road_id: str, coordinates, status: str = "approved") -> dict:
+    shape = road_shape(coordinates)
+    return {
+        "id": road_id, "status": status, "coordinates": coordinates,
+        "geo": to_geojson_linestring(coordinates), "shape": shape, "shape_bounds": line_bounds(shape),
+    }
+
+
+@pytest.fixture
+def roads_db(monkeypatch):
+    db = MemoryDatabase()
+    for module in (database, duplicates, submissions):
+        monkeypatch.setattr(module, "db", db)
+    return db
+
+
+def insert(db, docs):
+    asyncio.run(db.roads.insert_many(docs))
+
+
+def test_finds_duplicate_among_many_short_roads(roads_db):
+    # Short side streets lying inside the buffered area, stored before the duplicate
+    side_streets = []
+    for i in range(DUPLICATE_ROAD_CANDIDATE_LIMIT * 2):
+        t = (i + 1) / (DUPLICATE_ROAD_CANDIDATE_LIMIT * 2 + 1)
+        lat, lng = START[0] + (END[0] - START[0]) * t, START[1] + (END[1] - START[1]) * t
+        side_streets.append(road_doc(f"side-{i}", [[lat, lng], [lat + 0.0004, lng - 0.0004]]))
+    insert(roads_db, side_streets + [road_doc("original", street(offset_m=4))])
+
+    duplicate = asyncio.run(duplicates.find_duplicate_road(road_shape(street())))
+
+    assert duplicate is not None
+    assert duplicate["id"] == "original"
+    assert duplicate["distance"] <= 5
+
+
+def test_ignores_parallel_and_rejected_roads(roads_db):
+    insert(roads_db, [
+        road_doc("parallel", street(offset_m=40)),
+        road_doc("rejected", street(offset_m=2), status="rejected"),
+    ])
+
+    assert asyncio.run(duplicates.find_duplicate_road(road_shape(street()))) is None
+
+
+def test_prefers_closest_duplicate(roads_db):
+    insert(roads_db, [road_doc("far", street(offset_m=10)), road_doc("near", street(offset_m=3))])
+
+    assert asyncio.run(duplicates.find_duplicate_road(road_shape(street())))["id"] == "near"
+
+
+def test_batch_upload_marks_duplicates(roads_db, monkeypatch):
+    async def notify(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(submissions, "create_notification", notify)
+    insert(roads_db, [road_doc("original", street(offset_m=4))])
+    item = {"type": "road", "road_name": "خیابان آزادی", "road_type": "خیابان اصلی"}
+    items = [
+        {**item, "coordinates": street(offset_m=-40)},
+        {**item, "coordinates": street()},
+        {**item, "coordinates": street(offset_m=-38)},
+    ]
+
+    results = asyncio.run(submissions.submit_batch("user-1", items))["results"]
+
+    assert [result["status"] for result in results] == ["created"] * 3
+    stored = {road["id"]: road for road in asyncio.run(roads_db.roads.find({}).to_list(None))}
+    first, second, third = (stored[result["id"]] for result in results)
+    assert first["duplicate_of"] is None
+    assert second["duplicate_of"] == "original"
+    # Repeated trace of a street that is only in the same batch
+    assert third["duplicate_of"] == first["id"]
@@ -0,0 +1,89 @@
+"""
+Geometry helpers: bounding box queries and the encoded polyline codec
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+import pytest  # noqa: E402
+from pydantic import ValidationError  # noqa: E402
+
+from geo import BBOX_MAX_LAT, bbox_filter, bbox_polygon, decode_polyline, encode_polyline  # noqa: E402
+from models import RoadSubmissionCreate  # noqa: E402
+
+# Reference example from Google's encoded polyline algorithm documentation
+GOOGLE_POINTS = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+GOOGLE_POLYLINE = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def rings(query: dict, operator: str = "$geoIntersects"):
+    conditions = query.get("$or", [query])
+    return [condition["geo"][operator]["$geometry"]["coordinates"][0] for condition in conditions]
+
+
+def test_small_box_is_one_polygon():
+    query = bbox_filter("$geoIntersects", 34.0, 69.0, 35.0, 70.0)
+    assert list(query) == ["geo"]
+    ring = rings(query)[0]
+    assert ring[0] == ring[-1]
+    assert {lat for _, lat in ring} == {34.0, 35.0}
+
+
+def test_long_edges_are_densified():
+    ring = bbox_polygon(29.0, 45.0, 38.5, 60.0)["coordinates"][0]
+    bottom = [lng for lng, lat in ring if lat == 29.0]
+    assert max(b - a for a, b in zip(bottom, bottom[1:])) <= 0.1 + 1e-9
+
+
+def test_world_box_is_split_into_valid_pieces():
+    query = bbox_filter("$geoWithin", -90.0, -180.0, 90.0, 180.0)
+    pieces = rings(query, "$geoWithin")
+    assert len(pieces) > 2
+    for ring in pieces:
+        points = [tuple(point) for point in ring[:-1]]
+        # No repeated vertex (-180 and 180 are the same meridian), no edge on a pole
+        assert len(set(points)) == len(points)
+        assert max(lng for lng, _ in ring) - min(lng for lng, _ in ring) < 180
+        assert max(abs(lat) for _, lat in ring) == BBOX_MAX_LAT
+    assert pieces[0][0][0] == -180.0
+    assert max(lng for lng, _ in pieces[-1]) == 180.0
+
+
+def test_polyline_reference_vector():
+    assert encode_polyline(GOOGLE_POINTS) == GOOGLE_POLYLINE
+    assert decode_polyline(GOOGLE_POLYLINE) == GOOGLE_POINTS
+
+
+def test_polyline_round_trip():
+    line = [[35.71234, 51.40412], [35.71235, 51.40411], [-33.86785, 151.20732], [0.0, 0.0], [-89.99999, -179.99999]]
+    assert decode_polyline(encode_polyline(line)) == line
+    assert decode_polyline(encode_polyline([])) == []
+
+
+def test_polyline_round_trip_rounds_to_precision():
+    decoded = decode_polyline(encode_polyline([[35.7123449, 51.4041251]]))
+    assert decoded == [[35.71234, 51.40413]]
+
+
+@pytest.mark.parametrize("polyline", [
+    GOOGLE_POLYLINE[:-1],  # last value cut inside its varint
+    GOOGLE_POLYLINE[:-5],  # last latitude without its longitude
+    "_p~iF~ps|U ",  # character below the alphabet
+    "_p~iF~ps|U\x7f",  # character above the alphabet
+    "_p~iF~ps|Uا",  # non-ASCII
+])
+def test_polyline_rejects_malformed_input(polyline):
+    with pytest.raises(ValueError):
+        decode_polyline(polyline)
+
+
+def test_road_submission_accepts_polyline():
+    road = RoadSubmissionCreate(road_name="جاده", road_type="خیابان اصلی", polyline=GOOGLE_POLYLINE)
+    assert road.coordinates == GOOGLE_POINTS
+    assert road.polyline is None
+
+
+def test_road_submission_rejects_malformed_polyline():
+    with pytest.raises(ValidationError):
+        RoadSubmissionCreate(road_name="جاده", road_type="خیابان اصلی", polyline=GOOGLE_POLYLINE[:-1])
@@ -0,0 +1,64 @@
+"""
+Keyset pagination cursors, walked over the in-memory database stand-in
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+from memory_db import MemoryDatabase  # noqa: E402
+from pagination import KEYSET_SORT, decode_cursor, encode_cursor, next_cursor  # noqa: E402
+
+START = datetime(2026, 3, 1, 8, 30, tzinfo=timezone.utc)
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 3, 1, 8, 30, 15, 123000)
+    cursor = encode_cursor({"created_at": created_at, "id": "road-7"})
+
+    assert decode_cursor(cursor) == {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": "road-7"}},
+    ]}
+    # URL safe and unpadded
+    assert all(c.isalnum() or c in "-_" for c in cursor)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "e30", encode_cursor({"created_at": START, "id": "x"})[:-4]])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+def test_next_cursor_only_for_full_pages():
+    items = [{"created_at": START, "id": "a"}, {"created_at": START, "id": "b"}]
+    assert next_cursor(items, 3) is None
+    assert decode_cursor(next_cursor(items, 2)) == decode_cursor(encode_cursor(items[-1]))
+
+
+def test_pages_cover_every_document_once():
+    async def walk(page_size: int) -> list:
+        db = MemoryDatabase()
+        # Several documents share a timestamp, so the id has to break ties
+        await db.roads.insert_many([
+            {"id": f"road-{i:02d}", "created_at": START + timedelta(seconds=i // 3)} for i in range(20)
+        ])
+        seen, query = [], {}
+        while True:
+            page = await db.roads.find(query, {"_id": 0}).sort(KEYSET_SORT).limit(page_size).to_list(page_size)
+            seen.extend(doc["id"] for doc in page)
+            cursor = next_cursor(page, page_size)
+            if cursor is None:
+                return seen
+            query = decode_cursor(cursor)
+
+    expected = [f"road-{i:02d}" for i in reversed(range(20))]
+    for page_size in (1, 3, 7, 20):
+        assert asyncio.run(walk(page_size)) == expected
@@ -0,0 +1,160 @@
+"""
+Vector tile encoding, checked with an independent protobuf wire-format reader
+"""
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from config import TILE_EXTENT  # noqa: E402
+from tiles import encode_tile, tile_bounds, tile_range  # noqa: E402
+
+Z, X, Y = 14, 10531, 6450  # a tile over Tehran
+
+
+def read_varint(data: bytes, pos: int):
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+def read_message(data: bytes) -> list:
+    """[(field, value)] of a protobuf message; length-delimited values stay bytes"""
+    fields = []
+    pos = 0
+    while pos < len(data):
+        key, pos = read_varint(data, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == 0:
+            value, pos = read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = struct.unpack("<d", data[pos:pos + 8])[0], pos + 8
+        elif wire_type == 2:
+            length, pos = read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        else:
+            raise AssertionError(f"unexpected wire type {wire_type}")
+        fields.append((field, value))
+    assert pos == len(data)
+    return fields
+
+
+def read_packed(data: bytes) -> list:
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = read_varint(data, pos)
+        values.append(value)
+    return values
+
+
+def unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def decode_geometry(commands: list) -> list:
+    """Absolute tile-space points of a single MoveTo (+ LineTo) geometry"""
+    points, x, y, pos = [], 0, 0, 0
+    while pos < len(commands):
+        command, count = commands[pos] & 0x7, commands[pos] >> 3
+        assert command in (1, 2)
+        pos += 1
+        for _ in range(count):
+            x += unzigzag(commands[pos])
+            y += unzigzag(commands[pos + 1])
+            points.append((x, y))
+            pos += 2
+    return points
+
+
+def decode_tile(data: bytes) -> dict:
+    layers = {}
+    for field, raw_layer in read_message(data):
+        assert field == 3
+        layer = {"features": [], "keys": [], "values": []}
+        for lfield, value in read_message(raw_layer):
+            if lfield == 15:
+                layer["version"] = value
+            elif lfield == 1:
+                layer["name"] = value.decode("utf-8")
+            elif lfield == 2:
+                layer["features"].append(dict(read_message(value)))
+            elif lfield == 3:
+                layer["keys"].append(value.decode("utf-8"))
+            elif lfield == 4:
+                (vfield, raw), = read_message(value)
+                layer["values"].append(raw.decode("utf-8") if vfield == 1 else raw)
+            elif lfield == 5:
+                layer["extent"] = value
+        for feature in layer["features"]:
+            tags = read_packed(feature[2])
+            feature["properties"] = {
+                layer["keys"][k]: layer["values"][v] for k, v in zip(tags[::2], tags[1::2])
+            }
+            feature["points"] = decode_geometry(read_packed(feature[4]))
+        layers[layer["name"]] = layer
+    return layers
+
+
+def tile_point(fx: float, fy: float) -> list:
+    """[lat, lng] at a fraction of the test tile; fy grows southwards as in tile space"""
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(Z, X, Y)
+    # Linear in latitude is close enough inside one zoom-14 tile for rounding to whole units
+    return [max_lat - (max_lat - min_lat) * fy, min_lng + (max_lng - min_lng) * fx]
+
+
+def test_tile_range_of_tile_bounds_is_the_tile():
+    min_lat, min_lng, max_lat, max_lng = tile_bounds(Z, X, Y)
+    inset = 1e-9
+    assert tile_range(Z, min_lat + inset, min_lng + inset, max_lat - inset, max_lng - inset) == (X, Y, X, Y)
+
+
+def test_empty_tile_has_no_layers():
+    assert encode_tile(Z, X, Y, [], []) == b""
+
+
+def test_encodes_roads_and_pois():
+    roads = [
+        {"id": "r1", "road_name": "خیابان ولیعصر", "road_type": "خیابان اصلی",
+         "coordinates": [tile_point(0.25, 0.25), tile_point(0.75, 0.25), tile_point(0.75, 0.75)]},
+        # Leaves the tile to the north-west, so deltas go negative
+        {"id": "r2", "road_name": "کوچه", "road_type": "خیابان اصلی",
+         "coordinates": [tile_point(0.5, 0.5), tile_point(-0.01, -0.01)]},
+    ]
+    pois = [{"id": "p1", "name": "نانوایی", "category": "shop", "poi_type": "bakery", "location": tile_point(0.5, 0.5)}]
+
+    layers = decode_tile(encode_tile(Z, X, Y, roads, pois))
+
+    assert set(layers) == {"roads", "pois"}
+    road_layer, poi_layer = layers["roads"], layers["pois"]
+    assert road_layer["version"] == 2 and road_layer["extent"] == TILE_EXTENT
+
+    first, second = road_layer["features"]
+    assert first[3] == 2  # LINESTRING
+    assert first["properties"] == {"id": "r1", "road_name": "خیابان ولیعصر", "road_type": "خیابان اصلی"}
+    quarter, three_quarters = TILE_EXTENT // 4, TILE_EXTENT * 3 // 4
+    assert all(
+        abs(px - ex) <= 1 and abs(py - ey) <= 1
+        for (px, py), (ex, ey) in zip(first["points"], [(quarter, quarter), (three_quarters, quarter), (three_quarters, three_quarters)])
+    )
+    assert len(first["points"]) == 3
+    end = second["points"][-1]
+    assert end[0] < 0 and end[1] < 0
+    # Shared property values are stored once per layer
+    assert road_layer["values"].count("خیابان اصلی") == 1
+
+    (poi,) = poi_layer["features"]
+    assert poi[3] == 1  # POINT
+    assert poi["properties"] == {"id": "p1", "name": "نانوایی", "category": "shop", "poi_type": "bakery"}
+    (point,) = poi["points"]
+    assert abs(point[0] - TILE_EXTENT // 2) <= 1 and abs(point[1] - TILE_EXTENT // 2) <= 1
+
+
+def test_skips_roads_collapsing_to_one_point():
+    road = {"id": "r", "road_name": "x", "road_type": "y", "coordinates": [tile_point(0.5, 0.5), tile_point(0.50001, 0.5)]}
+    assert encode_tile(Z, X, Y, [road], []) == b""